@@ -0,0 +1,284 @@
+import os
+from argparse import ArgumentParser
+
+from PyQt6.QtWidgets import (
+    QApplication,
+    QMainWindow,
+    QHBoxLayout,
+    QWidget,
+    QStatusBar,
+    QLabel,
+    QToolBar,
+    QSizePolicy,
+    QDockWidget,
+)
+from PyQt6.QtCore import QEvent, QObject, QTemporaryDir, QTimer, Qt
+from PyQt6.QtGui import (
+    QCloseEvent, QFont, QAction, QKeySequence
+)
+
+from br.ui.widgets import (
+    BookReader,
+    DecoratedLabel,
+    DecoratedComboBox,
+    FontComboBox,
+    SearchPanel,
+    TocPanel,
+    LibraryView,
+)
+from br.ui.prefetch import Prefetcher
+from br.ui.multithreading import Worker
+from br.library import BookInfo, scan_library
+from br.utils import get_cache_dir
+
+
+DEFAULT_BOOK_FONT = 'Literata'
+DEFAULT_BOOK_FONT_SIZE = 15
+DEFAULT_BOOK_WIDTH_FACTOR = 0.75
+LIBRARY_INDEX_NAME = 'library.sqlite3'
+FONT_SIZES = [
+    8,
+    9,
+    10,
+    11,
+    12,
+    13,
+    14,
+    15,
+    16,
+    18,
+    20,
+    22,
+    24,
+    28,
+    30,
+    36,
+    40,
+    48,
+    54,
+    60,
+    72,
+    88,
+    96,
+]
+
+
+class MainWindow(QMainWindow):
+    def __init__(self, book_path: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.temp_dir = QTemporaryDir()
+        
+        self.main_layout = QHBoxLayout()
+        self.main_layout.setContentsMargins(0, 0, 0, 0)
+
+        screen_width = QApplication.primaryScreen().availableSize().width()
+        self.book_reader = BookReader()
+        self.book_reader.load_book(book_path, self.temp_dir.path())
+        self.book_reader.setMaximumWidth(
+            round(screen_width * DEFAULT_BOOK_WIDTH_FACTOR)
+        )
+        self.main_layout.addWidget(self.book_reader)
+        self.setWindowTitle(
+            f'{QApplication.applicationName()} - {self.book_reader.book.title}'
+        )
+
+        self.font_cbox = FontComboBox(DEFAULT_BOOK_FONT)
+        self.font_cbox.currentFontChanged.connect(self.book_reader.set_font)
+        self.book_reader.set_font(QFont(DEFAULT_BOOK_FONT))
+
+        font_size_cbox = DecoratedComboBox(FONT_SIZES, suffix=' pt')
+        font_size_cbox.currentTextChangedUndec.connect(
+            self._upd_book_reader_font_size
+        )
+        font_size_cbox.setCurrentIndex(
+            FONT_SIZES.index(DEFAULT_BOOK_FONT_SIZE)
+        )
+
+        tool_bar = QToolBar('Toolbar')
+        tool_bar.setContextMenuPolicy(Qt.ContextMenuPolicy.PreventContextMenu)
+        tool_bar.setMovable(False)
+        tool_bar.addWidget(self._create_spacer())
+        tool_bar.addWidget(self.font_cbox)
+        tool_bar.addWidget(font_size_cbox)
+        paginated_action = QAction('Paginated', self)
+        paginated_action.setCheckable(True)
+        paginated_action.toggled.connect(self._set_paginated)
+        tool_bar.addAction(paginated_action)
+        self.prefetcher = Prefetcher.from_env(self.book_reader, self)
+        self.prefetch_action = QAction('Prefetch', self)
+        self.prefetch_action.setCheckable(True)
+        self.prefetch_action.setToolTip(
+            'Illustrate upcoming passages ahead of the reading position'
+        )
+        self.prefetch_action.toggled.connect(self._set_prefetching)
+        self.prefetcher.budgetExhausted.connect(self._on_prefetch_budget)
+        tool_bar.addAction(self.prefetch_action)
+        toc_dock = QDockWidget('Contents', self)
+        toc_dock.setWidget(TocPanel(self.book_reader))
+        toc_dock.hide()
+        self.addDockWidget(Qt.DockWidgetArea.LeftDockWidgetArea, toc_dock)
+        tool_bar.addAction(toc_dock.toggleViewAction())
+        search_dock = QDockWidget('Search', self)
+        search_dock.setWidget(SearchPanel(self.book_reader))
+        search_dock.hide()
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, search_dock)
+        search_action = search_dock.toggleViewAction()
+        search_action.setShortcut(QKeySequence.StandardKey.Find)
+        tool_bar.addAction(search_action)
+        tool_bar.addWidget(self._create_spacer())
+        self.addToolBar(tool_bar)
+
+        status_bar = QStatusBar()
+        status_bar.setSizeGripEnabled(False)
+        status_bar.addWidget(QLabel(self.book_reader.book.title))
+        self.book_progress_label = DecoratedLabel(
+            prefix='Progress: ', suffix=' %'
+        )
+        self._update_book_prog_label()
+        self.book_reader.verticalScrollBar().valueChanged.connect(
+            self._update_book_prog_label
+        )
+        status_bar.addPermanentWidget(self.book_progress_label)
+        self.book_page_label = DecoratedLabel(prefix='Page: ')
+        self.book_page_label.setVisible(False)
+        self.book_reader.pageChanged.connect(self._update_book_page_label)
+        self.book_reader.generationStatusChanged.connect(
+            lambda message: self.statusBar().showMessage(message, 5000)
+        )
+        status_bar.addPermanentWidget(self.book_page_label)
+        self.setStatusBar(status_bar)
+
+        main_widget = QWidget()
+        main_widget.setLayout(self.main_layout)
+        self.setCentralWidget(main_widget)
+
+        self.book_reader.setFocus()
+        self.book_reader.viewport().installEventFilter(self)
+    
+    def _update_book_prog_label(self, *_):
+        self.book_progress_label.setNum(int(self.book_reader.progress() * 100))
+
+    def _update_book_page_label(self, page: int, page_count: int):
+        self.book_page_label.setText(f'{page + 1}/{page_count}')
+
+    def _set_paginated(self, enabled: bool):
+        self.book_reader.set_paginated(enabled)
+        self.book_progress_label.setVisible(not enabled)
+        self.book_page_label.setVisible(enabled)
+
+    def _set_prefetching(self, enabled: bool):
+        self.prefetcher.set_enabled(enabled)
+        if enabled and self.book_reader.generation_settings is None:
+            self.statusBar().showMessage(
+                'Prefetching starts after the first generated illustration',
+                5000,
+            )
+
+    def _on_prefetch_budget(self):
+        self.prefetch_action.setChecked(False)
+        self.statusBar().showMessage(
+            f'Prefetched {self.prefetcher.spent} illustrations, '
+            'the budget is exhausted',
+            5000,
+        )
+
+    def _create_spacer(
+        self,
+        hor_policy: QSizePolicy.Policy | None = None,
+        ver_policy: QSizePolicy.Policy | None = None,
+    ) -> QWidget:
+        if hor_policy is None:
+            hor_policy =  QSizePolicy.Policy.Expanding
+        if ver_policy is None:
+            ver_policy =  QSizePolicy.Policy.Preferred
+        spacer = QWidget()
+        spacer.setSizePolicy(hor_policy, ver_policy)
+        return spacer
+
+    def _upd_book_reader_font_size(self, size_str: str):
+        self.book_reader.set_font_pt_size(int(size_str))
+
+    def eventFilter(self, obj: QObject | None, event: QEvent | None) -> bool:
+        if (
+            obj is self.book_reader.viewport()
+            and event.type() == QEvent.Type.Paint
+        ):
+            obj.removeEventFilter(self)
+            # Listing the system fonts blocks, so it waits until the book
+            # is on screen
+            QTimer.singleShot(0, self.font_cbox.populate)
+        return super().eventFilter(obj, event)
+
+    def closeEvent(self, event: QCloseEvent | None):
+        self.book_reader.save_position()
+        self.temp_dir.remove()
+        super().closeEvent(event)
+
+
+class LibraryWindow(QMainWindow):
+    def __init__(self, library_dir: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setWindowTitle(
+            f'{QApplication.applicationName()} - {library_dir}'
+        )
+        self._book_windows: dict[str, MainWindow] = {}
+
+        self.library_view = LibraryView()
+        self.library_view.bookActivated.connect(self.open_book)
+        self.setCentralWidget(self.library_view)
+
+        status_bar = QStatusBar()
+        status_bar.setSizeGripEnabled(False)
+        self.library_status_label = QLabel('Scanning...')
+        status_bar.addWidget(self.library_status_label)
+        self.setStatusBar(status_bar)
+
+        worker = Worker(
+            scan_library,
+            library_dir,
+            os.path.join(get_cache_dir(), LIBRARY_INDEX_NAME),
+        )
+        worker.signals.result.connect(self._on_library_scanned)
+        self.library_view.thread_pool.start(worker)
+
+    def _on_library_scanned(self, books: list[BookInfo]):
+        self.library_view.set_books(books)
+        self.library_status_label.setText(f'{len(books)} books')
+
+    def open_book(self, book_path: str):
+        window = self._book_windows.get(book_path)
+        if window is None:
+            window = MainWindow(book_path)
+            window.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+            window.destroyed.connect(
+                lambda: self._book_windows.pop(book_path, None)
+            )
+            self._book_windows[book_path] = window
+        window.show()
+        window.activateWindow()
+
+
+def create_parser(*args, **kwargs) -> ArgumentParser:
+    parser = ArgumentParser(*args, **kwargs)
+    parser.add_argument(
+        'file', help='Path to the book or to a directory with books'
+    )
+    return parser
+
+
+def main(argv: list[str]) -> int:
+    parser = create_parser(prog='br')
+    known_args, unknown_args = parser.parse_known_args(argv[1:])
+
+    app = QApplication(argv[:1] + unknown_args)
+    app.setApplicationName('br')
+    app.setOrganizationName('br')
+
+    if os.path.isdir(known_args.file):
+        main_window = LibraryWindow(known_args.file)
+    else:
+        main_window = MainWindow(known_args.file)
+    main_window.show()
+
+    return app.exec()
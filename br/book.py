@@ -0,0 +1,48 @@
+import re
+import html
+from typing import NamedTuple
+
+import ebooklib
+from ebooklib.epub import EpubBook
+
+
+BLOCK_TAGS = (
+    'p',
+    'div',
+    'br',
+    'h[1-6]',
+    'li',
+    'tr',
+    'td',
+    'th',
+    'blockquote',
+    'section',
+)
+
+
+class Chapter(NamedTuple):
+    href: str
+    html: str
+
+
+def get_chapters(book: EpubBook) -> list[Chapter]:
+    chapters = []
+    for idref, _ in book.spine:
+        item = book.get_item_with_id(idref)
+        if item is None or item.get_type() != ebooklib.ITEM_DOCUMENT:
+            continue
+        chapters.append(
+            Chapter(item.get_name(), item.get_content().decode('utf-8'))
+        )
+    return chapters
+
+
+def html_to_text(s: str) -> str:
+    s = re.sub(r'<(head|style|script)\b.*?</\1\s*>', ' ', s, flags=re.S)
+    s = re.sub(rf'</?({"|".join(BLOCK_TAGS)})\b[^>]*>', ' ', s)
+    s = re.sub(r'<[^>]*>', '', s)
+    return re.sub(r'\s+', ' ', html.unescape(s)).strip()
+
+
+def truncate_str(s: str, l: int = 79, trun_char: str = '...') -> str:
+    return s[:l - len(trun_char)] + trun_char if len(s) > l else s
@@ -1,3 +1,70 @@
-from br.imagen.backends.sd_webui import SdWebUIBackend
-from br.imagen.backends.base import GenerationParamType, GenerationParam
-from br.imagen.backends.openai import OpenAIBackend
+from functools import cache
+from importlib import import_module
+from typing import NamedTuple, Any
+
+from br.imagen.backends.base import (
+    GenerationParamType, GenerationParam, ImagenBackend
+)
+
+
+ENTRY_POINT_GROUP = 'br.imagen.backends'
+_LAZY_EXPORTS = {
+    'SdWebUIBackend': 'br.imagen.backends.sd_webui',
+    'OpenAIBackend': 'br.imagen.backends.openai',
+    'LocalBackend': 'br.imagen.backends.local',
+}
+
+
+class BackendSpec(NamedTuple):
+    name: str
+    value: str
+
+    def load(self) -> type[ImagenBackend]:
+        module_name, _, attr = self.value.partition(':')
+        return getattr(import_module(module_name), attr)
+
+
+BUILTIN_BACKENDS = (
+    BackendSpec(
+        'Stable Diffusion WebUI', 'br.imagen.backends.sd_webui:SdWebUIBackend'
+    ),
+    BackendSpec('OpenAI', 'br.imagen.backends.openai:OpenAIBackend'),
+    BackendSpec('Local (CPU)', 'br.imagen.backends.local:LocalBackend'),
+)
+
+
+@cache
+def available_backends() -> dict[str, BackendSpec]:
+    from importlib.metadata import entry_points
+
+    backends = {spec.name: spec for spec in BUILTIN_BACKENDS}
+    for ep in entry_points(group=ENTRY_POINT_GROUP):
+        backends.setdefault(ep.name, BackendSpec(ep.name, ep.value))
+    return backends
+
+
+def create_backend(
+    name: str, owner: str | None = None, use_service: bool = True
+) -> ImagenBackend:
+    try:
+        spec = available_backends()[name]
+    except KeyError:
+        raise ValueError(f'Unknown Backend: {name}')
+    if use_service:
+        from br.imagen.service import connect_backend
+
+        # Jobs of the same owner, e.g. a book, share a turn in the queue
+        backend = connect_backend(name, owner)
+        if backend is not None:
+            return backend
+    return spec.load().from_env()
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module_name = _LAZY_EXPORTS[name]
+    except KeyError:
+        raise AttributeError(
+            f'module {__name__!r} has no attribute {name!r}'
+        ) from None
+    return getattr(import_module(module_name), name)
@@ -1,11 +1,12 @@
 from enum import Enum, auto
-from typing import TypedDict, Any
+from typing import TypedDict, Any, Self
 from abc import ABC, abstractmethod
 
 
 class GenerationParamType(Enum):
     COMBO_BOX = auto()
     INT_NUMBER = auto()
+    CHECK_BOX = auto()
 
 
 class GenerationParam(TypedDict):
@@ -15,6 +16,10 @@ class GenerationParam(TypedDict):
 
 
 class ImagenBackend(ABC):
+    @classmethod
+    def from_env(cls) -> Self:
+        return cls()
+
     @property
     @abstractmethod
     def generation_params(self) -> dict[str, GenerationParam]: ...
@@ -34,3 +39,27 @@ class ImagenBackend(ABC):
     def supports_neg_prompt(self) -> bool:
         return True
 
+    @property
+    def supports_drafts(self) -> bool:
+        return False
+
+    @property
+    def reports_progress(self) -> bool:
+        return False
+
+    def close(self):
+        pass
+
+    def generate_draft(
+        self, model_name: str, pos_prompt: str, *args, **kwargs
+    ) -> tuple[str, int]:
+        raise NotImplementedError(
+            f'{type(self).__name__} does not support drafts'
+        )
+
+    def refine_image(
+        self, img_data: str, model_name: str, pos_prompt: str, *args, **kwargs
+    ) -> str:
+        raise NotImplementedError(
+            f'{type(self).__name__} does not support drafts'
+        )
@@ -0,0 +1,336 @@
+import os
+import zlib
+import struct
+import hashlib
+import multiprocessing
+from base64 import b64encode
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+from typing import NamedTuple
+
+import numpy as np
+
+from br.imagen.backends.base import (
+    GenerationParam, GenerationParamType, ImagenBackend
+)
+
+
+LATTICE_SIZE = 256
+MAX_OCTAVES = 8
+MODEL_SEEDS = {'Landscape': 1, 'Nebula': 2}
+# Below this many pixels dispatching tiles costs more than rendering
+FAST_PATH_PIXELS = 256 * 256
+TILE_ROWS = 64
+LANDSCAPE_LAYERS = 3
+COLOR_WORDS = {
+    'red': (178, 34, 34),
+    'crimson': (153, 0, 37),
+    'scarlet': (204, 36, 20),
+    'orange': (230, 126, 34),
+    'amber': (255, 191, 0),
+    'golden': (218, 165, 32),
+    'gold': (218, 165, 32),
+    'yellow': (241, 196, 15),
+    'green': (39, 120, 60),
+    'emerald': (0, 155, 119),
+    'blue': (41, 98, 180),
+    'azure': (0, 127, 255),
+    'purple': (113, 54, 138),
+    'violet': (143, 94, 200),
+    'pink': (236, 143, 171),
+    'brown': (110, 72, 40),
+    'black': (20, 20, 24),
+    'white': (240, 240, 236),
+    'grey': (128, 128, 128),
+    'gray': (128, 128, 128),
+    'silver': (192, 192, 200),
+    'ivory': (255, 250, 230),
+    'dark': (30, 30, 48),
+    'pale': (220, 220, 210),
+}
+
+
+class LocalModel(NamedTuple):
+    name: str
+    lattices: np.ndarray
+
+
+@cache
+def load_model(name: str) -> LocalModel:
+    try:
+        seed = MODEL_SEEDS[name]
+    except KeyError:
+        raise ValueError(f'Unknown Model: {name}') from None
+    rng = np.random.default_rng(seed)
+    return LocalModel(
+        name,
+        rng.random((MAX_OCTAVES, LATTICE_SIZE, LATTICE_SIZE), np.float32),
+    )
+
+
+def _warm_up(model_names: tuple[str, ...]):
+    for name in model_names:
+        load_model(name)
+
+
+def get_prompt_seed(prompt: str) -> int:
+    return int.from_bytes(hashlib.md5(prompt.encode()).digest()[:4], 'little')
+
+
+def get_palette(prompt: str, seed: int, size: int = 4) -> np.ndarray:
+    words = prompt.lower().split()
+    colors = [COLOR_WORDS[w] for w in words if w in COLOR_WORDS][:size]
+    rng = np.random.default_rng(seed)
+    while len(colors) < size:
+        colors.append(tuple(rng.integers(30, 226, 3)))
+    return np.array(colors, dtype=np.float32)
+
+
+def _sample(lattice: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    x0, y0 = np.floor(x), np.floor(y)
+    # Smoothstep weights hide the lattice grid
+    tx, ty = x - x0, y - y0
+    tx, ty = tx * tx * (3 - 2 * tx), ty * ty * (3 - 2 * ty)
+    x0 = x0.astype(np.int64) % LATTICE_SIZE
+    y0 = y0.astype(np.int64) % LATTICE_SIZE
+    x1, y1 = (x0 + 1) % LATTICE_SIZE, (y0 + 1) % LATTICE_SIZE
+    top = lattice[y0, x0] * (1 - tx) + lattice[y0, x1] * tx
+    bottom = lattice[y1, x0] * (1 - tx) + lattice[y1, x1] * tx
+    return top * (1 - ty) + bottom * ty
+
+
+def fbm(
+    model: LocalModel,
+    x: np.ndarray,
+    y: np.ndarray,
+    octaves: int,
+    offset: float = 0.0,
+) -> np.ndarray:
+    total = np.zeros(np.broadcast_shapes(x.shape, y.shape), np.float32)
+    amplitude, norm = 1.0, 0.0
+    for octave in range(octaves):
+        freq = 2**octave
+        total += amplitude * _sample(
+            model.lattices[octave], x * freq + offset, y * freq + offset
+        )
+        norm += amplitude
+        amplitude /= 2
+    return total / norm
+
+
+def _render_landscape(
+    model: LocalModel,
+    palette: np.ndarray,
+    seed: int,
+    width: int,
+    height: int,
+    octaves: int,
+    rows: range,
+) -> np.ndarray:
+    scale = 4 / max(width, height)
+    offset = seed % 10007 / 7.0
+    x = np.arange(width, dtype=np.float32)[np.newaxis, :] * scale
+    y = np.arange(rows.start, rows.stop, dtype=np.float32)[:, np.newaxis]
+    horizon = y / height
+    pixels = palette[0] + (palette[1] - palette[0]) * horizon[..., np.newaxis]
+    clouds = fbm(model, x, y * scale * 2, octaves, offset)
+    clouds = np.clip((clouds - 0.55) * 4, 0, 1) * (1 - horizon)
+    pixels = pixels + (255 - pixels) * clouds[..., np.newaxis] * 0.8
+    for layer in range(LANDSCAPE_LAYERS):
+        # Ridges are 1D noise, sampled along a row of the lattice
+        ridge = fbm(
+            model, x[0], np.float32(layer * 17), octaves, offset + layer
+        )
+        base = 0.45 + 0.15 * layer
+        ridge_y = (base + (ridge - 0.5) * 0.5 / (layer + 1)) * height
+        color = palette[2] + (palette[3] - palette[2]) * (
+            layer / (LANDSCAPE_LAYERS - 1)
+        )
+        color = color * (1 - 0.2 * layer)
+        mask = y >= ridge_y[np.newaxis, :]
+        pixels[mask] = color
+    return pixels
+
+
+def _render_nebula(
+    model: LocalModel,
+    palette: np.ndarray,
+    seed: int,
+    width: int,
+    height: int,
+    octaves: int,
+    rows: range,
+) -> np.ndarray:
+    scale = 3 / max(width, height)
+    offset = seed % 10007 / 7.0
+    x = np.arange(width, dtype=np.float32)[np.newaxis, :] * scale
+    y = np.arange(rows.start, rows.stop, dtype=np.float32)[:, np.newaxis]
+    y = y * scale
+    # Domain warping turns plain noise into swirls
+    warp = fbm(model, x, y, octaves, offset)
+    value = fbm(model, x + warp * 2, y + warp * 2, octaves, offset + 3)
+    value = np.clip((value - 0.3) * 2.5, 0, 1)[..., np.newaxis] * (
+        len(palette) - 1
+    )
+    idx = np.minimum(value.astype(np.int64), len(palette) - 2)
+    t = value - idx
+    return palette[idx[..., 0]] * (1 - t) + palette[idx[..., 0] + 1] * t
+
+
+RENDERERS = {'Landscape': _render_landscape, 'Nebula': _render_nebula}
+
+
+def render_rows(
+    model_name: str,
+    prompt: str,
+    width: int,
+    height: int,
+    octaves: int,
+    rows: range,
+) -> np.ndarray:
+    seed = get_prompt_seed(prompt)
+    pixels = RENDERERS[model_name](
+        load_model(model_name),
+        get_palette(prompt, seed),
+        seed,
+        width,
+        height,
+        octaves,
+        rows,
+    )
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+def encode_png(pixels: np.ndarray) -> bytes:
+    height, width, _ = pixels.shape
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack('>I', len(data))
+            + tag
+            + data
+            + struct.pack('>I', zlib.crc32(tag + data))
+        )
+
+    raw = np.concatenate(
+        (np.zeros((height, 1), np.uint8), pixels.reshape(height, -1)), axis=1
+    )
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6))
+        + chunk(b'IEND', b'')
+    )
+
+
+class LocalBackend(ImagenBackend):
+    def __init__(self, max_workers: int | None = None):
+        super().__init__()
+        self._max_workers = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._generation_params = {
+            'model_name': GenerationParam(
+                type=GenerationParamType.COMBO_BOX,
+                display_name='Model',
+                params={'options': list(MODEL_SEEDS)},
+            ),
+            'width': GenerationParam(
+                type=GenerationParamType.INT_NUMBER,
+                display_name='Illustration Width',
+                params={'min_value': 64, 'max_value': 2048, 'init_value': 768},
+            ),
+            'height': GenerationParam(
+                type=GenerationParamType.INT_NUMBER,
+                display_name='Illustration Height',
+                params={'min_value': 64, 'max_value': 2048, 'init_value': 768},
+            ),
+            'steps': GenerationParam(
+                type=GenerationParamType.INT_NUMBER,
+                display_name='Detail',
+                params={
+                    'min_value': 1, 'max_value': MAX_OCTAVES, 'init_value': 6
+                },
+            ),
+        }
+
+    @classmethod
+    def from_env(cls) -> 'LocalBackend':
+        max_workers = os.environ.get('BR_LOCAL_BACKEND_WORKERS')
+        return cls(int(max_workers) if max_workers else None)
+
+    @property
+    def generation_params(self) -> dict[str, GenerationParam]:
+        return self._generation_params
+
+    @property
+    def supports_neg_prompt(self) -> bool:
+        return False
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Workers load the models once and stay warm between images.
+            # The backend runs beside Qt or the service's socket threads,
+            # and a forked child could inherit one of their locks held.
+            self._executor = ProcessPoolExecutor(
+                self._max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_warm_up,
+                initargs=(tuple(MODEL_SEEDS),),
+            )
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def _get_range(self, name: str) -> range:
+        params = self._generation_params[name]['params']
+        return range(params['min_value'], params['max_value'] + 1)
+
+    def render(
+        self,
+        model_name: str,
+        pos_prompt: str,
+        width: int,
+        height: int,
+        steps: int = 6,
+    ) -> np.ndarray:
+        if model_name not in MODEL_SEEDS:
+            raise ValueError(f'Unknown Model: {model_name}')
+        if (
+            width not in self._get_range('width')
+            or height not in self._get_range('height')
+        ):
+            raise ValueError(f'Invalid image dimensions: {width=}; {height=}')
+        steps = min(max(steps, 1), MAX_OCTAVES)
+        if width * height <= FAST_PATH_PIXELS:
+            return render_rows(
+                model_name, pos_prompt, width, height, steps, range(height)
+            )
+        tiles = [
+            range(start, min(start + TILE_ROWS, height))
+            for start in range(0, height, TILE_ROWS)
+        ]
+        futures = [
+            self.executor.submit(
+                render_rows, model_name, pos_prompt, width, height, steps, rows
+            )
+            for rows in tiles
+        ]
+        return np.concatenate([future.result() for future in futures])
+
+    def generate_image(
+        self,
+        model_name: str,
+        pos_prompt: str,
+        width: int | str = 768,
+        height: int | str = 768,
+        neg_prompt: str | None = None,
+        steps: int | str = 6,
+    ) -> str:
+        pixels = self.render(
+            model_name, pos_prompt, int(width), int(height), int(steps)
+        )
+        return b64encode(encode_png(pixels)).decode()
@@ -1,3 +1,7 @@
+import os
+import random
+from typing import Any
+
 import requests
 
 from br.imagen.backends.base import (
@@ -5,12 +9,21 @@ from br.imagen.backends.base import (
 )
 
 
+DRAFT_MAX_DIM = 512
+DRAFT_MIN_DIM = 64
+DRAFT_STEPS = 8
+REFINE_DENOISING_STRENGTH = 0.5
+MAX_SEED = 2**32 - 1
+
+
 class SdWebUIBackend(ImagenBackend):
     def __init__(self, host: str = '127.0.0.1', port: int = 7860):
         super().__init__()
         self._host = host
         self._port = port
         self._base_endpoint = f'http://{self._host}:{self._port}/sdapi/v1'
+        # Keeps the connection to the WebUI alive between requests
+        self._session = requests.Session()
         self._generation_params = {
             'model_name': GenerationParam(
                 type=GenerationParamType.COMBO_BOX,
@@ -46,8 +59,20 @@ class SdWebUIBackend(ImagenBackend):
                 display_name='Scheduler',
                 params={'options': self.schedulers},
             ),
+            'progressive': GenerationParam(
+                type=GenerationParamType.CHECK_BOX,
+                display_name='Draft First',
+                params={'init_value': False},
+            ),
         }
 
+    @classmethod
+    def from_env(cls) -> 'SdWebUIBackend':
+        return cls(
+            os.environ.get('SD_WEB_UI_API_HOST', '127.0.0.1'),
+            int(os.environ.get('SD_WEB_UI_API_PORT', 7860)),
+        )
+
     def _get_dim_range(self, dim: str) -> range:
         try:
             dim_params = self._generation_params[dim]['params']
@@ -77,20 +102,30 @@ class SdWebUIBackend(ImagenBackend):
 
     @property
     def samplers(self) -> list[str]:
-        r = requests.get(f'{self._base_endpoint}/samplers').json()
+        r = self._session.get(f'{self._base_endpoint}/samplers').json()
         return [sampler['name'] for sampler in r]
 
     @property
     def schedulers(self) -> list[str]:
-        r = requests.get(f'{self._base_endpoint}/schedulers').json()
+        r = self._session.get(f'{self._base_endpoint}/schedulers').json()
         return [scheduler['label'] for scheduler in r]
 
     @property
     def models(self) -> list[str]:
-        r = requests.get(f'{self._base_endpoint}/sd-models').json()
+        r = self._session.get(f'{self._base_endpoint}/sd-models').json()
         return [model['model_name'] for model in r]
 
-    def generate_image(
+    @property
+    def supports_drafts(self) -> bool:
+        return True
+
+    def close(self):
+        self._session.close()
+
+    def _get_options(self, name: str) -> list[str]:
+        return self._generation_params[name]['params']['options']
+
+    def _create_payload(
         self,
         model_name: str,
         pos_prompt: str,
@@ -101,9 +136,15 @@ class SdWebUIBackend(ImagenBackend):
         sampler: str | None = None,
         scheduler: str | None = 'Karras',
         **kwargs,
-    ) -> str:
-        if model_name not in self.models:
-            raise ValueError(f'Unknown Model: {model_name}')
+    ) -> dict[str, Any]:
+        # Options are listed once, only a model the server has gained
+        # since then needs another request
+        if model_name not in self._get_options('model_name'):
+            self._generation_params['model_name']['params']['options'] = (
+                self.models
+            )
+            if model_name not in self._get_options('model_name'):
+                raise ValueError(f'Unknown Model: {model_name}')
         if not self._is_valid_img_dims(width, height):
             raise ValueError(f'Invalid image dimensions: {width=}; {height=}')
         payload = {
@@ -117,10 +158,107 @@ class SdWebUIBackend(ImagenBackend):
             payload['negative_prompt'] = neg_prompt
         if steps in self._get_dim_range('steps'):
             payload['steps'] = steps
-        if sampler in self.samplers:
+        if sampler in self._get_options('sampler'):
             payload['sampler_name'] = sampler
-        if scheduler in self.schedulers:
+        if scheduler in self._get_options('scheduler'):
             payload['scheduler'] = scheduler
-        r = requests.post(f'{self._base_endpoint}/txt2img', json=payload).json()
+        return payload
+
+    def _post(self, endpoint: str, payload: dict[str, Any]) -> str:
+        r = self._session.post(
+            f'{self._base_endpoint}/{endpoint}', json=payload
+        ).json()
         return r['images'][0]
-    
+
+    def generate_image(
+        self,
+        model_name: str,
+        pos_prompt: str,
+        width: int | str = 1024,
+        height: int | str = 1024,
+        neg_prompt: str | None = None,
+        steps: int | None = 30,
+        sampler: str | None = None,
+        scheduler: str | None = 'Karras',
+        progressive: bool = False,
+        **kwargs,
+    ) -> str:
+        args = (
+            model_name,
+            pos_prompt,
+            width,
+            height,
+            neg_prompt,
+            steps,
+            sampler,
+            scheduler,
+        )
+        if progressive:
+            draft, seed = self.generate_draft(*args, **kwargs)
+            kwargs['seed'] = seed
+            return self.refine_image(draft, *args, **kwargs)
+        return self._post('txt2img', self._create_payload(*args, **kwargs))
+
+    def generate_draft(
+        self,
+        model_name: str,
+        pos_prompt: str,
+        width: int | str = 1024,
+        height: int | str = 1024,
+        neg_prompt: str | None = None,
+        steps: int | None = 30,
+        sampler: str | None = None,
+        scheduler: str | None = 'Karras',
+        seed: int = -1,
+        **kwargs,
+    ) -> tuple[str, int]:
+        if seed == -1:
+            seed = random.randint(0, MAX_SEED)
+        payload = self._create_payload(
+            model_name,
+            pos_prompt,
+            width,
+            height,
+            neg_prompt,
+            DRAFT_STEPS if steps is None else min(steps, DRAFT_STEPS),
+            sampler,
+            scheduler,
+            seed=seed,
+            **kwargs,
+        )
+        scale = min(
+            DRAFT_MAX_DIM / max(payload['width'], payload['height']), 1
+        )
+        for dim in ('width', 'height'):
+            payload[dim] = max(
+                round(payload[dim] * scale / 8) * 8, DRAFT_MIN_DIM
+            )
+        return self._post('txt2img', payload), seed
+
+    def refine_image(
+        self,
+        img_data: str,
+        model_name: str,
+        pos_prompt: str,
+        width: int | str = 1024,
+        height: int | str = 1024,
+        neg_prompt: str | None = None,
+        steps: int | None = 30,
+        sampler: str | None = None,
+        scheduler: str | None = 'Karras',
+        **kwargs,
+    ) -> str:
+        payload = self._create_payload(
+            model_name,
+            pos_prompt,
+            width,
+            height,
+            neg_prompt,
+            steps,
+            sampler,
+            scheduler,
+            **kwargs,
+        )
+        payload['init_images'] = [img_data]
+        payload.setdefault('denoising_strength', REFINE_DENOISING_STRENGTH)
+        return self._post('img2img', payload)
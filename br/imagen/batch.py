@@ -0,0 +1,281 @@
+import os
+import sys
+import json
+import html
+import posixpath
+from argparse import ArgumentParser
+from base64 import b64decode
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import closing
+from itertools import groupby
+
+from ebooklib import epub
+
+from br.book import Chapter, get_chapters, truncate_str
+from br.imagen import NEG_PROMPT
+from br.imagen.backends import available_backends, create_backend
+from br.imagen.backends.base import (
+    GenerationParam, GenerationParamType, ImagenBackend
+)
+from br.imagen.passages import (
+    PARAGRAPH_RE, Passage, segment_chapters, rank_passages
+)
+
+
+ILLUSTRATIONS_DIR = 'Images/br'
+ILLUSTRATION_TEMPLATE = (
+    '<div class="br-illustration" style="text-align: center">'
+    '<img src="{src}" alt="{alt}"/></div>'
+)
+BOOL_VALUES = {
+    'true': True, 'yes': True, '1': True,
+    'false': False, 'no': False, '0': False,
+}
+
+
+def select_passages(
+    chapters: list[Chapter], every: int | None = None, top_k: int = 1
+) -> list[Passage]:
+    if not every:
+        return rank_passages(chapters, top_k)
+    passages = []
+    for _, candidates in groupby(
+        segment_chapters(chapters), key=lambda p: p.chapter
+    ):
+        passages.extend(list(candidates)[every - 1::every])
+    return passages
+
+
+def read_checkpoint(checkpoint_path: str) -> dict[str, dict]:
+    done = {}
+    try:
+        with open(checkpoint_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                done[record['key']] = record
+    except OSError:
+        pass
+    return done
+
+
+def illustrate_passage(
+    backend: ImagenBackend,
+    passage: Passage,
+    image_path: str,
+    **generation_params,
+) -> str:
+    img_data = backend.generate_image(
+        pos_prompt=passage.text,
+        neg_prompt=NEG_PROMPT if backend.supports_neg_prompt else None,
+        **generation_params,
+    )
+    with open(image_path, 'wb') as f:
+        f.write(b64decode(img_data))
+    return image_path
+
+
+def write_illustrated_epub(
+    book: epub.EpubBook,
+    chapters: list[Chapter],
+    records: list[dict],
+    work_dir: str,
+    out_path: str,
+):
+    by_chapter: dict[int, list[dict]] = {}
+    for record in records:
+        by_chapter.setdefault(record['chapter'], []).append(record)
+    for chapter_idx, chapter_records in by_chapter.items():
+        chapter = chapters[chapter_idx]
+        item = book.get_item_with_href(chapter.href)
+        paragraph_ends = [
+            m.end() for m in PARAGRAPH_RE.finditer(chapter.html)
+        ]
+        content = chapter.html
+        for record in sorted(
+            chapter_records, key=lambda r: r['paragraph'], reverse=True
+        ):
+            file_name = f'{ILLUSTRATIONS_DIR}/{record["image"]}'
+            with open(os.path.join(work_dir, record['image']), 'rb') as f:
+                book.add_item(
+                    epub.EpubImage(
+                        uid=f'br-{record["key"]}',
+                        file_name=file_name,
+                        media_type='image/png',
+                        content=f.read(),
+                    )
+                )
+            src = posixpath.relpath(file_name, posixpath.dirname(chapter.href))
+            pos = paragraph_ends[record['paragraph']]
+            content = (
+                content[:pos]
+                + ILLUSTRATION_TEMPLATE.format(
+                    src=html.escape(src), alt=html.escape(record['caption'])
+                )
+                + content[pos:]
+            )
+        item.content = content.encode('utf-8')
+    epub.write_epub(out_path, book)
+
+
+def parse_params(
+    params: list[str], generation_params: dict[str, GenerationParam]
+) -> dict[str, int | bool | str]:
+    parsed = {}
+    for param in params:
+        name, sep, value = param.partition('=')
+        if not sep:
+            raise ValueError(f'Invalid Parameter: {param}')
+        if name not in generation_params:
+            raise ValueError(f'Unknown Parameter: {name}')
+        param_type = generation_params[name]['type']
+        if param_type == GenerationParamType.INT_NUMBER:
+            try:
+                parsed[name] = int(value)
+            except ValueError:
+                raise ValueError(f'Invalid Number: {param}') from None
+        elif param_type == GenerationParamType.CHECK_BOX:
+            if value.lower() not in BOOL_VALUES:
+                raise ValueError(f'Invalid Boolean: {param}')
+            parsed[name] = BOOL_VALUES[value.lower()]
+        else:
+            parsed[name] = value
+    return parsed
+
+
+def create_parser(*args, **kwargs) -> ArgumentParser:
+    parser = ArgumentParser(*args, **kwargs)
+    parser.add_argument('file', help='Path to the book')
+    parser.add_argument(
+        '-o', '--output', required=True, help='Path to the illustrated book'
+    )
+    parser.add_argument(
+        '-b',
+        '--backend',
+        default='Stable Diffusion WebUI',
+        choices=list(available_backends()),
+        help='Illustration backend',
+    )
+    parser.add_argument(
+        '-p',
+        '--param',
+        action='append',
+        default=[],
+        metavar='NAME=VALUE',
+        help='Generation parameter, e.g. model_name=... or steps=20',
+    )
+    parser.add_argument(
+        '-n',
+        '--every',
+        type=int,
+        default=None,
+        help='Illustrate every N-th paragraph instead of the best ranked',
+    )
+    parser.add_argument(
+        '-k',
+        '--top-k',
+        type=int,
+        default=1,
+        help='Number of best ranked passages to illustrate per chapter',
+    )
+    parser.add_argument(
+        '-j', '--workers', type=int, default=2, help='Concurrent generations'
+    )
+    parser.add_argument(
+        '--work-dir',
+        default=None,
+        help='Directory for generated images and the checkpoint',
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = create_parser(prog='br illustrate')
+    args = parser.parse_args(argv)
+    work_dir = args.work_dir or f'{args.output}.br-batch'
+    os.makedirs(work_dir, exist_ok=True)
+    checkpoint_path = os.path.join(work_dir, 'checkpoint.jsonl')
+
+    book = epub.read_epub(args.file)
+    chapters = get_chapters(book)
+    passages = select_passages(chapters, args.every, args.top_k)
+    done = read_checkpoint(checkpoint_path)
+    pending = [p for p in passages if p.key not in done]
+    print(
+        f'{len(passages)} passages, {len(passages) - len(pending)} done',
+        file=sys.stderr,
+    )
+
+    failed = 0
+    if pending:
+        backend = create_backend(args.backend)
+        try:
+            generation_params = parse_params(
+                args.param, backend.generation_params
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        with (
+            closing(backend),
+            open(checkpoint_path, 'a') as checkpoint,
+            ThreadPoolExecutor(args.workers) as executor,
+        ):
+            futures = {
+                executor.submit(
+                    illustrate_passage,
+                    backend,
+                    passage,
+                    os.path.join(work_dir, f'{passage.key}.png'),
+                    **generation_params,
+                ): passage
+                for passage in pending
+            }
+            handled = 0
+
+            def handle_result(future: Future) -> bool:
+                nonlocal handled
+                handled += 1
+                passage = futures.pop(future)
+                progress = f'[{handled}/{len(pending)}] {passage.key}'
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f'{progress}: {e}', file=sys.stderr)
+                    return False
+                record = {
+                    'key': passage.key,
+                    'chapter': passage.chapter,
+                    'paragraph': passage.paragraph,
+                    'image': f'{passage.key}.png',
+                    'caption': truncate_str(passage.text),
+                }
+                done[passage.key] = record
+                checkpoint.write(json.dumps(record) + '\n')
+                checkpoint.flush()
+                print(progress, file=sys.stderr)
+                return True
+
+            try:
+                for future in as_completed(list(futures)):
+                    failed += not handle_result(future)
+            except KeyboardInterrupt:
+                print(
+                    'Interrupted, finishing started generations',
+                    file=sys.stderr,
+                )
+                executor.shutdown(cancel_futures=True)
+                # Generations that were already running are kept, so a
+                # resumed run does not repeat them
+                for future in list(futures):
+                    if not future.cancelled():
+                        handle_result(future)
+                return 130
+
+    records = [done[p.key] for p in passages if p.key in done]
+    write_illustrated_epub(book, chapters, records, work_dir, args.output)
+    print(
+        f'Wrote {len(records)} illustrations to {args.output}', file=sys.stderr
+    )
+    return 1 if failed else 0
@@ -0,0 +1,80 @@
+from argparse import ArgumentParser
+from time import perf_counter
+
+from br.imagen import NEG_PROMPT
+from br.imagen.backends import available_backends, create_backend
+from br.imagen.backends.base import ImagenBackend
+from br.imagen.batch import parse_params
+
+
+DEFAULT_PROMPT = (
+    'An old castle on a dark hill under the red moon, a river glittering '
+    'silver beside the forest'
+)
+
+
+def time_generations(
+    backend: ImagenBackend, prompt: str, runs: int, **generation_params
+) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = perf_counter()
+        backend.generate_image(
+            pos_prompt=prompt,
+            neg_prompt=NEG_PROMPT if backend.supports_neg_prompt else None,
+            **generation_params,
+        )
+        timings.append(perf_counter() - start)
+    return timings
+
+
+def create_parser(*args, **kwargs) -> ArgumentParser:
+    parser = ArgumentParser(*args, **kwargs)
+    parser.add_argument(
+        '-b',
+        '--backend',
+        default='Local (CPU)',
+        choices=list(available_backends()),
+        help='Illustration backend',
+    )
+    parser.add_argument(
+        '-p',
+        '--param',
+        action='append',
+        default=[],
+        metavar='NAME=VALUE',
+        help='Generation parameter, e.g. model_name=... or steps=20',
+    )
+    parser.add_argument(
+        '-n', '--runs', type=int, default=5, help='Number of generations'
+    )
+    parser.add_argument('--prompt', default=DEFAULT_PROMPT, help='Prompt')
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = create_parser(prog='br benchmark')
+    args = parser.parse_args(argv)
+    if args.runs < 1:
+        parser.error('At least one run is required')
+    start = perf_counter()
+    backend = create_backend(args.backend)
+    setup = perf_counter() - start
+    try:
+        generation_params = parse_params(args.param, backend.generation_params)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        # The first generation also pays for connections and model loading
+        first, *rest = time_generations(
+            backend, args.prompt, args.runs, **generation_params
+        )
+    finally:
+        backend.close()
+    print(f'{args.backend}: setup {setup:.3f}s, first {first:.3f}s')
+    if rest:
+        print(
+            f'{len(rest)} warm runs: mean {sum(rest) / len(rest):.3f}s, '
+            f'min {min(rest):.3f}s, max {max(rest):.3f}s'
+        )
+    return 0
@@ -0,0 +1,140 @@
+import re
+from itertools import chain
+from typing import NamedTuple
+
+import numpy as np
+
+from br.book import Chapter, html_to_text, truncate_str
+
+
+PARAGRAPH_RE = re.compile(r'<p\b[^>]*>.*?</p\s*>', re.S)
+TOKEN_RE = re.compile(r'\w+|["“”]')
+WORD_RE = re.compile(r'\w')
+MIN_PASSAGE_LENGTH = 100
+PROMPT_MAX_LENGTH = 400
+IDEAL_PASSAGE_WORDS = 120
+DESCRIPTIVE_SUFFIXES = ('ous', 'ful', 'ish', 'less', 'ive')
+DESCRIPTIVE_WORDS = frozenset(
+    """
+    red orange yellow green blue purple violet pink brown black white grey
+    gray golden silver crimson scarlet azure emerald amber ivory pale dark
+    bright light shadow shadows glow glowing gleam gleaming glitter glittered
+    shining shone sparkling dim dusk dawn twilight sunset sunrise moon
+    moonlight sun sunlight stars star sky clouds cloud mist fog smoke fire
+    flame flames rain snow storm wind thunder lightning sea ocean waves river
+    lake water shore beach sand stone stones rock rocks cliff cliffs mountain
+    mountains hill hills valley forest woods wood trees tree leaves branches
+    grass field fields meadow garden flowers flower roses road path bridge
+    castle tower towers walls wall gate city town village street streets
+    house hall palace temple church ruins room window windows door doors
+    stairs ship ships boat horse horses dragon sword armor armour cloak
+    crown throne banner candle candles lantern torch mirror glass gold iron
+    steel wooden marble velvet silk feathers fur wings eyes hair face
+    towering ancient vast huge tiny enormous narrow wide tall deep
+    """.split()
+)
+FEATURE_WEIGHTS = np.array([1.0, 1.5, -1.0, 0.5])
+
+
+class Passage(NamedTuple):
+    chapter: int
+    paragraph: int
+    text: str
+    score: float = 0.0
+
+    @property
+    def key(self) -> str:
+        return f'c{self.chapter}_p{self.paragraph}'
+
+
+def get_paragraphs(chapter: Chapter) -> list[str]:
+    return [
+        html_to_text(m.group()) for m in PARAGRAPH_RE.finditer(chapter.html)
+    ]
+
+
+def segment_chapters(chapters: list[Chapter]) -> list[Passage]:
+    return [
+        Passage(i, j, text)
+        for i, chapter in enumerate(chapters)
+        for j, text in enumerate(get_paragraphs(chapter))
+        # Separators like '* * *' are long enough but have nothing to score
+        if len(text) >= MIN_PASSAGE_LENGTH and WORD_RE.search(text)
+    ]
+
+
+def _zscore(x: np.ndarray) -> np.ndarray:
+    std = x.std()
+    return (x - x.mean()) / std if std else np.zeros_like(x)
+
+
+def score_passages(passages: list[Passage]) -> np.ndarray:
+    n_passages = len(passages)
+    if not n_passages:
+        return np.zeros(0)
+    tokenized = [TOKEN_RE.findall(p.text.lower()) for p in passages]
+    lengths = np.fromiter(
+        map(len, tokenized), dtype=np.int64, count=n_passages
+    )
+    vocab, token_ids = np.unique(
+        np.array(list(chain.from_iterable(tokenized))), return_inverse=True
+    )
+    passage_ids = np.repeat(np.arange(n_passages), lengths)
+
+    is_quote = np.isin(vocab, ('"', '“', '”'))[token_ids]
+    is_word = ~is_quote
+    word_counts = np.maximum(
+        np.bincount(passage_ids, weights=is_word, minlength=n_passages), 1
+    )
+
+    # Quote parity restarts at the beginning of every passage
+    quotes_before = np.cumsum(is_quote) - is_quote
+    passage_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    parity = (quotes_before - quotes_before[passage_starts][passage_ids]) % 2
+    dialogue = np.bincount(
+        passage_ids, weights=is_word & (parity == 1), minlength=n_passages
+    ) / word_counts
+
+    pairs, tf = np.unique(
+        passage_ids[is_word] * len(vocab) + token_ids[is_word],
+        return_counts=True,
+    )
+    pair_passages, pair_tokens = np.divmod(pairs, len(vocab))
+    df = np.bincount(pair_tokens, minlength=len(vocab))
+    idf = np.log(n_passages / np.maximum(df, 1))
+    tfidf = np.bincount(
+        pair_passages, weights=tf * idf[pair_tokens], minlength=n_passages
+    ) / word_counts
+
+    is_descriptive = np.isin(vocab, list(DESCRIPTIVE_WORDS))
+    for suffix in DESCRIPTIVE_SUFFIXES:
+        is_descriptive |= np.char.endswith(vocab, suffix)
+    descriptive = np.bincount(
+        passage_ids, weights=is_descriptive[token_ids], minlength=n_passages
+    ) / word_counts
+
+    length_fit = -np.abs(np.log(word_counts / IDEAL_PASSAGE_WORDS))
+
+    features = np.stack([tfidf, descriptive, dialogue, length_fit], axis=1)
+    features = np.apply_along_axis(_zscore, 0, features)
+    return features @ FEATURE_WEIGHTS
+
+
+def rank_passages(chapters: list[Chapter], top_k: int = 1) -> list[Passage]:
+    passages = segment_chapters(chapters)
+    if not passages:
+        return []
+    scores = score_passages(passages)
+    chapter_ids = np.array([p.chapter for p in passages])
+    order = np.lexsort((-scores, chapter_ids))
+    sorted_chapters = chapter_ids[order]
+    chapter_starts = np.searchsorted(sorted_chapters, sorted_chapters)
+    ranks = np.arange(len(order)) - chapter_starts
+    selected = np.sort(order[ranks < top_k])
+    return [
+        passages[i]._replace(
+            text=truncate_str(passages[i].text, PROMPT_MAX_LENGTH),
+            score=float(scores[i]),
+        )
+        for i in selected
+    ]
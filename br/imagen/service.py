@@ -0,0 +1,416 @@
+import os
+import sys
+import json
+import socket
+import tempfile
+import socketserver
+from argparse import ArgumentParser
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from itertools import count
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, NamedTuple
+from uuid import uuid4
+
+from br.imagen.backends import create_backend
+from br.imagen.backends.base import (
+    GenerationParam, GenerationParamType, ImagenBackend
+)
+
+
+SOCKET_ENV = 'BR_SERVICE_SOCKET'
+GENERATION_METHODS = ('generate_image', 'generate_draft', 'refine_image')
+ERROR_TYPES = {
+    'ValueError': ValueError, 'NotImplementedError': NotImplementedError
+}
+
+
+def get_socket_path() -> str:
+    return os.environ.get(SOCKET_ENV) or os.path.join(
+        os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+        f'br-{os.getuid()}.sock',
+    )
+
+
+def encode_message(message: dict[str, Any]) -> bytes:
+    # Some backends list their options as tuples or dict views
+    return json.dumps(message, default=list).encode() + b'\n'
+
+
+def describe_backend(backend: ImagenBackend) -> dict[str, Any]:
+    return {
+        'generation_params': {
+            name: {**param, 'type': param['type'].name}
+            for name, param in backend.generation_params.items()
+        },
+        'supports_neg_prompt': backend.supports_neg_prompt,
+        'supports_drafts': backend.supports_drafts,
+    }
+
+
+class Job(NamedTuple):
+    client: 'ServiceHandler'
+    owner: str
+    id: int
+    backend: str
+    method: str
+    args: list[Any]
+    kwargs: dict[str, Any]
+
+
+class JobQueue:
+    def __init__(self):
+        self._queues: OrderedDict[tuple[int, str], deque[Job]] = (
+            OrderedDict()
+        )
+        self._cond = Condition()
+
+    def put(self, job: Job) -> int:
+        with self._cond:
+            key = (id(job.client), job.owner)
+            queue = self._queues.setdefault(key, deque())
+            queue.append(job)
+            self._cond.notify()
+            return self._count_ahead(key, len(queue) - 1)
+
+    def _count_ahead(self, key: tuple[int, str], idx: int) -> int:
+        # Every queue before this one in the rotation runs up to idx + 1
+        # jobs first, every queue after it up to idx
+        ahead, before = idx, True
+        for other_key, queue in self._queues.items():
+            if other_key == key:
+                before = False
+            else:
+                ahead += min(len(queue), idx + before)
+        return ahead
+
+    def get(self) -> Job:
+        with self._cond:
+            while not self._queues:
+                self._cond.wait()
+            # Readers take turns, so a long batch never starves a book
+            key, queue = next(iter(self._queues.items()))
+            job = queue.popleft()
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            return job
+
+    def drop(self, client: 'ServiceHandler'):
+        with self._cond:
+            for key in [k for k in self._queues if k[0] == id(client)]:
+                del self._queues[key]
+
+
+class ServiceHandler(socketserver.StreamRequestHandler):
+    server: 'IllustrationService'
+
+    def setup(self):
+        super().setup()
+        self._send_lock = Lock()
+
+    def send(self, message: dict[str, Any]):
+        try:
+            with self._send_lock:
+                self.wfile.write(encode_message(message))
+                self.wfile.flush()
+        except OSError:
+            pass
+
+    def handle(self):
+        for line in self.rfile:
+            request = {}
+            try:
+                request = json.loads(line)
+                self._handle_request(request)
+            except Exception as e:
+                self.send(
+                    {
+                        'id': request.get('id'),
+                        'error': str(e),
+                        'type': type(e).__name__,
+                    }
+                )
+
+    def finish(self):
+        self.server.jobs.drop(self)
+        super().finish()
+
+    def _handle_request(self, request: dict[str, Any]):
+        method = request['method']
+        if method == 'describe':
+            self.send(
+                {
+                    'id': request['id'],
+                    'result': self.server.describe(request['backend']),
+                }
+            )
+        elif method in GENERATION_METHODS:
+            # Fail early instead of after waiting in the queue
+            self.server.get_backend(request['backend'])
+            job = Job(
+                self,
+                request.get('owner', ''),
+                request['id'],
+                request['backend'],
+                method,
+                request.get('args', []),
+                request.get('kwargs', {}),
+            )
+            ahead = self.server.jobs.put(job)
+            self.send(
+                {
+                    'id': job.id,
+                    'status': {'state': 'queued', 'ahead': ahead},
+                }
+            )
+        else:
+            raise ValueError(f'Unknown Method: {method}')
+
+
+class IllustrationService(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, workers: int = 1):
+        self.jobs = JobQueue()
+        self._backends: dict[str, ImagenBackend] = {}
+        self._descriptions: dict[str, dict[str, Any]] = {}
+        self._backends_lock = Lock()
+        super().__init__(socket_path, ServiceHandler)
+        os.chmod(socket_path, 0o600)
+        for _ in range(workers):
+            Thread(target=self._run_jobs, daemon=True).start()
+
+    def get_backend(self, name: str) -> ImagenBackend:
+        with self._backends_lock:
+            backend = self._backends.get(name)
+            if backend is None:
+                backend = create_backend(name, use_service=False)
+                self._backends[name] = backend
+            return backend
+
+    def describe(self, name: str) -> dict[str, Any]:
+        description = self._descriptions.get(name)
+        if description is None:
+            description = describe_backend(self.get_backend(name))
+            self._descriptions[name] = description
+        return description
+
+    def server_close(self):
+        super().server_close()
+        with self._backends_lock:
+            for backend in self._backends.values():
+                backend.close()
+
+    def _run_jobs(self):
+        while True:
+            job = self.jobs.get()
+            job.client.send({'id': job.id, 'status': {'state': 'running'}})
+            try:
+                backend = self.get_backend(job.backend)
+                result = getattr(backend, job.method)(*job.args, **job.kwargs)
+            except Exception as e:
+                job.client.send(
+                    {'id': job.id, 'error': str(e), 'type': type(e).__name__}
+                )
+            else:
+                job.client.send({'id': job.id, 'result': result})
+
+
+class ServiceClient:
+    def __init__(self, socket_path: str):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(socket_path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._rfile = self._socket.makefile('rb')
+        self._send_lock = Lock()
+        self._ids = count()
+        self._pending: dict[int, tuple[Future, Callable | None]] = {}
+        self.connected = True
+        Thread(target=self._read_responses, daemon=True).start()
+
+    def call(
+        self,
+        method: str,
+        progress_callback: Callable[[dict], Any] | None = None,
+        **params,
+    ) -> Any:
+        future = Future()
+        request_id = next(self._ids)
+        self._pending[request_id] = (future, progress_callback)
+        try:
+            with self._send_lock:
+                self._socket.sendall(
+                    encode_message(
+                        {'id': request_id, 'method': method, **params}
+                    )
+                )
+        except OSError:
+            self._pending.pop(request_id, None)
+            raise
+        return future.result()
+
+    def _read_responses(self):
+        try:
+            for line in self._rfile:
+                self._handle_response(json.loads(line))
+        except OSError:
+            pass
+        finally:
+            self.connected = False
+            for future, _ in list(self._pending.values()):
+                future.set_exception(
+                    ConnectionError('Illustration service disconnected')
+                )
+            self._pending.clear()
+
+    def _handle_response(self, response: dict[str, Any]):
+        if response.get('id') not in self._pending:
+            return
+        if 'status' in response:
+            _, progress_callback = self._pending[response['id']]
+            if progress_callback is not None:
+                progress_callback(response['status'])
+            return
+        future, _ = self._pending.pop(response['id'])
+        if 'error' in response:
+            future.set_exception(
+                ERROR_TYPES.get(response['type'], RuntimeError)(
+                    response['error']
+                )
+            )
+        else:
+            future.set_result(response['result'])
+
+
+class ServiceBackend(ImagenBackend):
+    def __init__(
+        self, client: ServiceClient, name: str, owner: str | None = None
+    ):
+        super().__init__()
+        self._client = client
+        self.name = name
+        self.owner = owner or uuid4().hex
+        description = client.call('describe', backend=name)
+        self._generation_params = {
+            param_name: GenerationParam(
+                type=GenerationParamType[param['type']],
+                display_name=param['display_name'],
+                params=param['params'],
+            )
+            for param_name, param in description['generation_params'].items()
+        }
+        self._supports_neg_prompt = description['supports_neg_prompt']
+        self._supports_drafts = description['supports_drafts']
+
+    @property
+    def generation_params(self) -> dict[str, GenerationParam]:
+        return self._generation_params
+
+    @property
+    def supports_neg_prompt(self) -> bool:
+        return self._supports_neg_prompt
+
+    @property
+    def supports_drafts(self) -> bool:
+        return self._supports_drafts
+
+    @property
+    def reports_progress(self) -> bool:
+        return True
+
+    def _generate(
+        self,
+        method: str,
+        *args,
+        progress_callback: Callable[[dict], Any] | None = None,
+        **kwargs,
+    ) -> Any:
+        return self._client.call(
+            method,
+            progress_callback,
+            backend=self.name,
+            owner=self.owner,
+            args=args,
+            kwargs=kwargs,
+        )
+
+    def generate_image(self, *args, **kwargs) -> str:
+        return self._generate('generate_image', *args, **kwargs)
+
+    def generate_draft(self, *args, **kwargs) -> tuple[str, int]:
+        return tuple(self._generate('generate_draft', *args, **kwargs))
+
+    def refine_image(self, *args, **kwargs) -> str:
+        return self._generate('refine_image', *args, **kwargs)
+
+
+_client: ServiceClient | None = None
+_client_lock = Lock()
+
+
+def get_client() -> ServiceClient | None:
+    global _client
+    with _client_lock:
+        if _client is None or not _client.connected:
+            try:
+                _client = ServiceClient(get_socket_path())
+            except OSError:
+                _client = None
+        return _client
+
+
+def connect_backend(
+    name: str, owner: str | None = None
+) -> ServiceBackend | None:
+    client = get_client()
+    if client is None:
+        return None
+    try:
+        return ServiceBackend(client, name, owner)
+    except (OSError, ValueError):
+        # Backends the service does not know are created locally
+        return None
+
+
+def create_parser(*args, **kwargs) -> ArgumentParser:
+    parser = ArgumentParser(*args, **kwargs)
+    parser.add_argument(
+        '-s',
+        '--socket',
+        default=get_socket_path(),
+        help=f'Path to the Unix socket, defaults to ${SOCKET_ENV}',
+    )
+    parser.add_argument(
+        '-j', '--workers', type=int, default=1, help='Concurrent generations'
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = create_parser(prog='br serve')
+    args = parser.parse_args(argv)
+    if os.path.exists(args.socket):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.connect(args.socket)
+        except OSError:
+            # Left behind by a service that did not shut down cleanly
+            os.remove(args.socket)
+        else:
+            parser.error(f'Service is already running at {args.socket}')
+    with IllustrationService(args.socket, args.workers) as service:
+        print(f'Listening on {args.socket}', file=sys.stderr)
+        try:
+            service.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(args.socket)
+    return 0
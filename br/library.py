@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import posixpath
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from typing import NamedTuple
+from urllib.parse import unquote
+from zipfile import ZipFile, BadZipFile
+from xml.etree import ElementTree
+
+
+CONTAINER_PATH = 'META-INF/container.xml'
+NAMESPACES = {
+    'container': 'urn:oasis:names:tc:opendocument:xmlns:container',
+    'opf': 'http://www.idpf.org/2007/opf',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+}
+# Spawning workers for a handful of books costs more than reading them
+MIN_PARALLEL_SCAN = 16
+LIBRARY_INDEX_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS books (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    title TEXT NOT NULL,
+    author TEXT,
+    cover TEXT
+)
+'''
+
+
+class BookInfo(NamedTuple):
+    path: str
+    mtime: float
+    title: str
+    author: str | None = None
+    cover: str | None = None
+
+
+def _find_text(root: ElementTree.Element, path: str) -> str | None:
+    el = root.find(path, NAMESPACES)
+    if el is None or not el.text or not el.text.strip():
+        return None
+    return el.text.strip()
+
+
+def _find_cover(root: ElementTree.Element) -> str | None:
+    manifest = root.find('opf:manifest', NAMESPACES)
+    if manifest is None:
+        return None
+    for item in manifest.iterfind('opf:item', NAMESPACES):
+        if 'cover-image' in item.get('properties', '').split():
+            return item.get('href')
+    meta = root.find("opf:metadata/opf:meta[@name='cover']", NAMESPACES)
+    if meta is not None:
+        for item in manifest.iterfind('opf:item', NAMESPACES):
+            if item.get('id') == meta.get('content'):
+                return item.get('href')
+    return None
+
+
+def read_book_info(path: str) -> BookInfo | None:
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    title = os.path.splitext(os.path.basename(path))[0]
+    try:
+        with ZipFile(path) as zip:
+            container = ElementTree.fromstring(zip.read(CONTAINER_PATH))
+            rootfile = container.find(
+                'container:rootfiles/container:rootfile', NAMESPACES
+            )
+            opf_path = rootfile.get('full-path')
+            opf = ElementTree.fromstring(zip.read(opf_path))
+    except (
+        OSError, KeyError, AttributeError, BadZipFile, ElementTree.ParseError
+    ):
+        return BookInfo(path, mtime, title)
+    cover = _find_cover(opf)
+    if cover is not None:
+        cover = posixpath.normpath(
+            posixpath.join(posixpath.dirname(opf_path), unquote(cover))
+        )
+    return BookInfo(
+        path,
+        mtime,
+        _find_text(opf, 'opf:metadata/dc:title') or title,
+        _find_text(opf, 'opf:metadata/dc:creator'),
+        cover,
+    )
+
+
+def read_cover(book: BookInfo) -> bytes | None:
+    if book.cover is None:
+        return None
+    try:
+        with ZipFile(book.path) as zip:
+            return zip.read(book.cover)
+    except (OSError, KeyError, BadZipFile):
+        return None
+
+
+def find_books(directory: str) -> dict[str, float]:
+    books = {}
+    for root, _, files in os.walk(directory):
+        for file in files:
+            if file.lower().endswith('.epub'):
+                path = os.path.abspath(os.path.join(root, file))
+                try:
+                    books[path] = os.path.getmtime(path)
+                except OSError:
+                    continue
+    return books
+
+
+def scan_library(
+    directory: str, index_path: str, max_workers: int | None = None
+) -> list[BookInfo]:
+    directory = os.path.abspath(directory)
+    books = find_books(directory)
+    with closing(sqlite3.connect(index_path)) as db, db:
+        db.execute(LIBRARY_INDEX_SCHEMA)
+        prefix = os.path.join(directory, '')
+        indexed = {
+            path: BookInfo(path, *row)
+            for path, *row in db.execute(
+                'SELECT path, mtime, title, author, cover FROM books'
+            )
+            if path.startswith(prefix)
+        }
+        stale = [
+            path
+            for path, mtime in books.items()
+            if path not in indexed or indexed[path].mtime != mtime
+        ]
+        if len(stale) < MIN_PARALLEL_SCAN:
+            scanned = list(map(read_book_info, stale))
+        else:
+            # Forking a process with running Qt threads is unsafe
+            with ProcessPoolExecutor(
+                max_workers, mp_context=multiprocessing.get_context('spawn')
+            ) as executor:
+                scanned = list(
+                    executor.map(read_book_info, stale, chunksize=8)
+                )
+        # Books deleted or made unreadable during the scan are dropped
+        for path, book in zip(stale, scanned):
+            if book is None:
+                del books[path]
+        scanned = [book for book in scanned if book is not None]
+        db.executemany(
+            'INSERT OR REPLACE INTO books VALUES (?, ?, ?, ?, ?)', scanned
+        )
+        db.executemany(
+            'DELETE FROM books WHERE path = ?',
+            [(path,) for path in indexed if path not in books],
+        )
+    indexed.update((book.path, book) for book in scanned)
+    return sorted(
+        (indexed[path] for path in books), key=lambda b: b.title.lower()
+    )
@@ -0,0 +1,190 @@
+import re
+import json
+from bisect import bisect_left
+from typing import Callable, NamedTuple
+
+from br.book import html_to_text
+
+
+SEARCH_INDEX_VERSION = 1
+TOKEN_RE = re.compile(r'\w+')
+QUERY_TERM_RE = re.compile(r'\w+\*?')
+QUERY_RE = re.compile(r'"([^"]*)"|(\w+\*?)')
+SNIPPET_CONTEXT = 40
+
+
+class ChapterIndex(NamedTuple):
+    text: str
+    tokens: list[str]
+    offsets: list[int]
+
+
+class SearchHit(NamedTuple):
+    chapter: int
+    start: int
+    end: int
+
+
+def index_chapter(html: str) -> ChapterIndex:
+    text = html_to_text(html)
+    tokens, offsets = [], []
+    for match in TOKEN_RE.finditer(text):
+        tokens.append(match.group().lower())
+        offsets.append(match.start())
+    return ChapterIndex(text, tokens, offsets)
+
+
+class SearchIndex:
+    def __init__(self):
+        self._chapters: dict[int, ChapterIndex] = {}
+        self._postings: dict[str, list[tuple[int, int]]] = {}
+        self._sorted_tokens: list[str] | None = None
+
+    @property
+    def chapter_count(self) -> int:
+        return len(self._chapters)
+
+    def add_chapter(self, chapter_idx: int, chapter: ChapterIndex):
+        if chapter_idx in self._chapters:
+            raise ValueError(f'Chapter {chapter_idx} is already indexed')
+        self._chapters[chapter_idx] = chapter
+        for token_idx, token in enumerate(chapter.tokens):
+            self._postings.setdefault(token, []).append(
+                (chapter_idx, token_idx)
+            )
+        self._sorted_tokens = None
+
+    def _expand_term(self, term: str) -> list[str]:
+        if not term.endswith('*'):
+            return [term]
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._postings)
+        prefix = term[:-1]
+        tokens = []
+        i = bisect_left(self._sorted_tokens, prefix)
+        while (
+            i < len(self._sorted_tokens)
+            and self._sorted_tokens[i].startswith(prefix)
+        ):
+            tokens.append(self._sorted_tokens[i])
+            i += 1
+        return tokens
+
+    def _term_positions(
+        self, term: str, chapter_idx: int | None
+    ) -> set[tuple[int, int]]:
+        return {
+            pos
+            for token in self._expand_term(term)
+            for pos in self._postings.get(token, ())
+            if chapter_idx is None or pos[0] == chapter_idx
+        }
+
+    def _phrase_positions(
+        self, terms: list[str], chapter_idx: int | None
+    ) -> set[tuple[int, int]]:
+        positions = self._term_positions(terms[0], chapter_idx)
+        for i, term in enumerate(terms[1:], 1):
+            if not positions:
+                break
+            next_positions = self._term_positions(term, chapter_idx)
+            positions = {
+                (ch, idx)
+                for ch, idx in positions
+                if (ch, idx + i) in next_positions
+            }
+        return positions
+
+    def search(
+        self, query: str, chapter_idx: int | None = None
+    ) -> list[SearchHit]:
+        phrases = [
+            [term.lower() for term in QUERY_TERM_RE.findall(phrase or term)]
+            for phrase, term in QUERY_RE.findall(query)
+        ]
+        phrases = [terms for terms in phrases if terms]
+        if not phrases:
+            return []
+        matches = [
+            (terms, self._phrase_positions(terms, chapter_idx))
+            for terms in phrases
+        ]
+        # Every word and quoted phrase has to occur in the same chapter
+        chapters = set.intersection(
+            *({ch for ch, _ in positions} for _, positions in matches)
+        )
+        hits = set()
+        for terms, positions in matches:
+            for ch, idx in positions:
+                if ch not in chapters:
+                    continue
+                chapter = self._chapters[ch]
+                last_idx = idx + len(terms) - 1
+                hits.add(
+                    SearchHit(
+                        ch,
+                        chapter.offsets[idx],
+                        chapter.offsets[last_idx]
+                        + len(chapter.tokens[last_idx]),
+                    )
+                )
+        return sorted(hits)
+
+    def hit_text(self, hit: SearchHit) -> str:
+        return self._chapters[hit.chapter].text[hit.start:hit.end]
+
+    def hit_occurrence(self, hit: SearchHit) -> int:
+        # Matches before the hit, counted the way QTextDocument.find does
+        text = self._chapters[hit.chapter].text[:hit.start].lower()
+        return text.count(self.hit_text(hit).lower())
+
+    def snippet(self, hit: SearchHit) -> str:
+        text = self._chapters[hit.chapter].text
+        start = max(hit.start - SNIPPET_CONTEXT, 0)
+        end = min(hit.end + SNIPPET_CONTEXT, len(text))
+        return (
+            ('...' if start else '')
+            + text[start:end]
+            + ('...' if end < len(text) else '')
+        )
+
+    def chapter_length(self, chapter_idx: int) -> int:
+        return len(self._chapters[chapter_idx].text)
+
+
+def _load_chapter_indices(cache_path: str, chapter_count: int):
+    try:
+        with open(cache_path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        data.get('version') != SEARCH_INDEX_VERSION
+        or len(data.get('chapters', ())) != chapter_count
+    ):
+        return None
+    return [ChapterIndex(*chapter) for chapter in data['chapters']]
+
+
+def build_search_index(
+    chapter_htmls: list[str],
+    cache_path: str | None = None,
+    progress_callback: Callable[[object], None] | None = None,
+) -> int:
+    chapters = None
+    if cache_path is not None:
+        chapters = _load_chapter_indices(cache_path, len(chapter_htmls))
+    from_cache = chapters is not None
+    if chapters is None:
+        chapters = []
+    for i, html in enumerate(chapter_htmls):
+        if not from_cache:
+            chapters.append(index_chapter(html))
+        if progress_callback is not None:
+            progress_callback((i, chapters[i]))
+    if cache_path is not None and not from_cache:
+        with open(cache_path, 'w') as f:
+            json.dump(
+                {'version': SEARCH_INDEX_VERSION, 'chapters': chapters}, f
+            )
+    return len(chapters)
@@ -0,0 +1,128 @@
+import sys
+import json
+import subprocess
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import NamedTuple
+
+
+STARTUP_TIMEOUT_MS = 30000
+POLL_INTERVAL_MS = 5
+
+
+class StartupTimings(NamedTuple):
+    imports: float
+    window: float
+    first_paint: float
+    font_list: float
+
+
+def measure_startup(book_path: str, bundled_fonts: bool) -> StartupTimings:
+    start = perf_counter()
+    if not bundled_fonts:
+        # Behaves like a build without the compiled resources
+        sys.modules['br.resources'] = None
+    from PyQt6.QtCore import QEvent, QObject, QTimer
+    from PyQt6.QtWidgets import QApplication
+
+    from br.app import MainWindow
+    from br.ui.utils import get_bundled_font_files
+
+    imports = perf_counter() - start
+    app = QApplication(sys.argv[:1])
+    app.setApplicationName('br')
+    app.setOrganizationName('br')
+    if bundled_fonts and not get_bundled_font_files():
+        raise RuntimeError(
+            'Bundled fonts are missing, compile br/resources.py'
+        )
+    window = MainWindow(book_path)
+    window.show()
+    window_time = perf_counter() - start
+    timings = {}
+
+    class PaintFilter(QObject):
+        def eventFilter(self, obj, event) -> bool:
+            if event.type() == QEvent.Type.Paint:
+                timings.setdefault('first_paint', perf_counter() - start)
+            return False
+
+    def poll():
+        if window.font_cbox.populated:
+            timings['font_list'] = perf_counter() - start
+            app.quit()
+
+    paint_filter = PaintFilter()
+    window.book_reader.viewport().installEventFilter(paint_filter)
+    timer = QTimer()
+    timer.timeout.connect(poll)
+    timer.start(POLL_INTERVAL_MS)
+    QTimer.singleShot(STARTUP_TIMEOUT_MS, app.quit)
+    app.exec()
+    window.close()
+    if len(timings) < 2:
+        raise RuntimeError('Window did not finish starting up')
+    return StartupTimings(
+        imports, window_time, timings['first_paint'], timings['font_list']
+    )
+
+
+def create_parser(*args, **kwargs) -> ArgumentParser:
+    parser = ArgumentParser(*args, **kwargs)
+    parser.add_argument('file', help='Path to the book')
+    parser.add_argument(
+        '-n', '--runs', type=int, default=5, help='Number of startups'
+    )
+    parser.add_argument(
+        '--measure',
+        choices=('bundled', 'system'),
+        help='Measure a single startup in this process and print it as JSON',
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = create_parser(prog='br benchmark-startup')
+    args = parser.parse_args(argv)
+    if args.measure:
+        timings = measure_startup(args.file, args.measure == 'bundled')
+        print(json.dumps(timings._asdict()))
+        return 0
+    if args.runs < 1:
+        parser.error('At least one run is required')
+    for fonts in ('bundled', 'system'):
+        runs = []
+        for _ in range(args.runs):
+            # Every startup needs a fresh process to pay for the imports
+            result = subprocess.run(
+                [
+                    sys.executable,
+                    '-m',
+                    'br',
+                    'benchmark-startup',
+                    args.file,
+                    '--measure',
+                    fonts,
+                ],
+                capture_output=True,
+                text=True,
+            )
+            if result.returncode:
+                print(
+                    f'{fonts} fonts: {result.stderr.strip().splitlines()[-1]}',
+                    file=sys.stderr,
+                )
+                break
+            runs.append(
+                StartupTimings(**json.loads(result.stdout.splitlines()[-1]))
+            )
+        if not runs:
+            continue
+        means = StartupTimings(
+            *(sum(values) / len(values) for values in zip(*runs))
+        )
+        print(
+            f'{fonts} fonts, {len(runs)} runs: '
+            + ', '.join(f'{k} {v:.3f}s' for k, v in means._asdict().items())
+        )
+    return 0
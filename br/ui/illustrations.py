@@ -0,0 +1,93 @@
+import os
+from collections import OrderedDict
+from typing import NamedTuple
+
+from PyQt6.QtCore import QSize
+from PyQt6.QtGui import QPixmap, QImageReader
+
+
+MAX_DECODED_BYTES = 64 * 2**20
+
+
+class IllustrationCacheStats(NamedTuple):
+    stored: int
+    stored_bytes: int
+    decoded: int
+    decoded_bytes: int
+    max_decoded_bytes: int
+    hits: int
+    misses: int
+
+
+def get_pixmap_bytes(pixmap: QPixmap) -> int:
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+
+class IllustrationStore:
+    def __init__(
+        self, store_dir: str, max_decoded_bytes: int = MAX_DECODED_BYTES
+    ):
+        self.store_dir = store_dir
+        self.max_decoded_bytes = max_decoded_bytes
+        self._sizes: dict[str, int] = {}
+        self._decoded: OrderedDict[str, QPixmap] = OrderedDict()
+        self._decoded_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        os.makedirs(store_dir, exist_ok=True)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sizes
+
+    def _get_path(self, name: str) -> str:
+        return os.path.join(self.store_dir, name)
+
+    def add(self, name: str, img_data: bytes) -> QSize:
+        with open(self._get_path(name), 'wb') as f:
+            f.write(img_data)
+        self._sizes[name] = len(img_data)
+        self._evict(name)
+        # Only reads the header, the image is decoded when it is painted
+        return QImageReader(self._get_path(name)).size()
+
+    def remove(self, name: str):
+        if self._sizes.pop(name, None) is None:
+            return
+        self._evict(name)
+        os.remove(self._get_path(name))
+
+    def _evict(self, name: str):
+        pixmap = self._decoded.pop(name, None)
+        if pixmap is not None:
+            self._decoded_bytes -= get_pixmap_bytes(pixmap)
+
+    def pixmap(self, name: str) -> QPixmap | None:
+        if name not in self._sizes:
+            return None
+        pixmap = self._decoded.get(name)
+        if pixmap is not None:
+            self._hits += 1
+            self._decoded.move_to_end(name)
+            return pixmap
+        self._misses += 1
+        pixmap = QPixmap(self._get_path(name))
+        self._decoded[name] = pixmap
+        self._decoded_bytes += get_pixmap_bytes(pixmap)
+        # The pixmap being requested stays even if it exceeds the budget
+        while (
+            self._decoded_bytes > self.max_decoded_bytes
+            and len(self._decoded) > 1
+        ):
+            self._evict(next(iter(self._decoded)))
+        return pixmap
+
+    def stats(self) -> IllustrationCacheStats:
+        return IllustrationCacheStats(
+            len(self._sizes),
+            sum(self._sizes.values()),
+            len(self._decoded),
+            self._decoded_bytes,
+            self.max_decoded_bytes,
+            self._hits,
+            self._misses,
+        )
@@ -5,15 +5,20 @@ from PyQt6.QtCore import QRunnable, QObject, pyqtSignal
 
 class WorkerSignals(QObject):
     result = pyqtSignal(object)
+    progress = pyqtSignal(object)
 
 
 class Worker(QRunnable):
-    def __init__(self, fn: Callable, *args, **kwargs):
+    def __init__(
+        self, fn: Callable, *args, report_progress: bool = False, **kwargs
+    ):
         super().__init__()
         self._fn = fn
         self._args = args
         self._kwargs = kwargs
         self.signals = WorkerSignals()
+        if report_progress:
+            self._kwargs['progress_callback'] = self.signals.progress.emit
 
     def run(self):
         self.signals.result.emit(self._fn(*self._args, **self._kwargs))
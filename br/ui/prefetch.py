@@ -0,0 +1,254 @@
+import os
+from time import monotonic
+from itertools import accumulate
+from typing import TYPE_CHECKING, Any, Callable, NamedTuple
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+from br.book import Chapter, html_to_text, truncate_str
+from br.imagen import NEG_PROMPT
+from br.imagen.backends.base import ImagenBackend
+from br.ui.multithreading import Worker
+from br.ui.utils import Illustration
+from br.ui.widgets import BookReader
+
+if TYPE_CHECKING:
+    from br.imagen.passages import Passage
+
+
+PREFETCH_PRIORITY = -1
+PREFETCH_TOP_K = 1
+MAX_PREFETCH_JOBS = 2
+DEFAULT_LOOKAHEAD_S = 600
+DEFAULT_BUDGET = 10
+UPDATE_DELAY_MS = 500
+# Characters per second, roughly 200 words per minute
+DEFAULT_READING_SPEED = 15.0
+MIN_READING_SPEED = 2.0
+MAX_READING_SPEED = 100.0
+READING_SPEED_SMOOTHING = 0.3
+MIN_SAMPLE_INTERVAL_S = 10
+MAX_SAMPLE_INTERVAL_S = 300
+MAX_READING_STEP = 5000
+NEEDLE_LENGTH = 40
+
+
+class PrefetchTarget(NamedTuple):
+    passage: 'Passage'
+    offset: int
+    offset_ratio: float
+
+
+class PrefetchPlan(NamedTuple):
+    chapter_starts: list[int]
+    chapter_lengths: list[int]
+    targets: list[PrefetchTarget]
+
+
+def plan_prefetch(
+    chapters: list[Chapter], top_k: int = PREFETCH_TOP_K
+) -> PrefetchPlan:
+    # Ranking needs numpy, which is not worth loading unless prefetching
+    from br.imagen.passages import PARAGRAPH_RE, rank_passages
+
+    chapter_lengths = [len(html_to_text(c.html)) for c in chapters]
+    chapter_starts = list(accumulate(chapter_lengths, initial=0))[:-1]
+    paragraph_counts = [len(PARAGRAPH_RE.findall(c.html)) for c in chapters]
+    targets = []
+    for passage in rank_passages(chapters, top_k):
+        idx = passage.chapter
+        offset_ratio = passage.paragraph / max(paragraph_counts[idx], 1)
+        offset = chapter_starts[idx] + round(
+            chapter_lengths[idx] * offset_ratio
+        )
+        targets.append(PrefetchTarget(passage, offset, offset_ratio))
+    return PrefetchPlan(chapter_starts, chapter_lengths, targets)
+
+
+def generate_passage_image(
+    backend: ImagenBackend, passage: 'Passage', **generation_params
+) -> str | None:
+    try:
+        return backend.generate_image(
+            pos_prompt=passage.text,
+            neg_prompt=NEG_PROMPT if backend.supports_neg_prompt else None,
+            **generation_params,
+        )
+    except Exception:
+        return None
+
+
+class Prefetcher(QObject):
+    budgetExhausted = pyqtSignal()
+
+    def __init__(
+        self,
+        book_reader: BookReader,
+        lookahead_s: int = DEFAULT_LOOKAHEAD_S,
+        budget: int = DEFAULT_BUDGET,
+        parent: QObject | None = None,
+    ):
+        super().__init__(parent)
+        self.book_reader = book_reader
+        self.lookahead_s = lookahead_s
+        self.budget = budget
+        self.spent = 0
+        self.reading_speed = DEFAULT_READING_SPEED
+        self._enabled = False
+        self._plan: PrefetchPlan | None = None
+        self._planning = False
+        self._last_sample: tuple[float, int] | None = None
+        self._jobs: dict[str, tuple[PrefetchTarget, Worker]] = {}
+        self._done: set[str] = set()
+        self._update_timer = QTimer(self)
+        self._update_timer.setSingleShot(True)
+        self._update_timer.setInterval(UPDATE_DELAY_MS)
+        self._update_timer.timeout.connect(self._update)
+        book_reader.verticalScrollBar().valueChanged.connect(
+            lambda: self._update_timer.start()
+        )
+
+    @classmethod
+    def from_env(
+        cls, book_reader: BookReader, parent: QObject | None = None
+    ) -> 'Prefetcher':
+        return cls(
+            book_reader,
+            int(os.getenv('BR_PREFETCH_LOOKAHEAD', DEFAULT_LOOKAHEAD_S)),
+            int(os.getenv('BR_PREFETCH_BUDGET', DEFAULT_BUDGET)),
+            parent,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def set_enabled(self, enabled: bool):
+        self._enabled = enabled
+        self._last_sample = None
+        if enabled:
+            self._update()
+        else:
+            self._cancel_jobs(lambda target: True)
+
+    def _start_planning(self):
+        if self._planning:
+            return
+        self._planning = True
+        worker = Worker(plan_prefetch, self.book_reader.chapters)
+        worker.signals.result.connect(self._handle_plan)
+        self.book_reader.thread_pool.start(worker, PREFETCH_PRIORITY)
+
+    def _handle_plan(self, plan: PrefetchPlan):
+        self._plan = plan
+        self._planning = False
+        self._update()
+
+    def _book_offset(self, pos: int) -> int:
+        chapter_idx, offset_ratio = self.book_reader.position_to_ratio(pos)
+        return self._plan.chapter_starts[chapter_idx] + round(
+            self._plan.chapter_lengths[chapter_idx] * offset_ratio
+        )
+
+    def _sample_reading_speed(self, offset: int):
+        now = monotonic()
+        if self._last_sample is not None:
+            last_time, last_offset = self._last_sample
+            elapsed, step = now - last_time, offset - last_offset
+            if elapsed < MIN_SAMPLE_INTERVAL_S:
+                return
+            # Jumps, going back and long pauses say nothing about the speed
+            if (
+                0 < step <= MAX_READING_STEP
+                and elapsed <= MAX_SAMPLE_INTERVAL_S
+            ):
+                speed = min(
+                    max(step / elapsed, MIN_READING_SPEED), MAX_READING_SPEED
+                )
+                self.reading_speed += READING_SPEED_SMOOTHING * (
+                    speed - self.reading_speed
+                )
+        self._last_sample = (now, offset)
+
+    def _cancel_jobs(self, predicate: Callable[[PrefetchTarget], bool]):
+        for key, (target, worker) in list(self._jobs.items()):
+            if predicate(target) and self.book_reader.thread_pool.tryTake(
+                worker
+            ):
+                del self._jobs[key]
+                self.spent -= 1
+
+    def _update(self):
+        if not self._enabled or not self.book_reader.chapters:
+            return
+        if self._plan is None:
+            self._start_planning()
+            return
+        offset = self._book_offset(self.book_reader.reading_position())
+        self._sample_reading_speed(offset)
+        horizon = offset + self.reading_speed * self.lookahead_s
+        self._cancel_jobs(
+            lambda target: not offset <= target.offset <= horizon
+        )
+        if self.book_reader.generation_settings is None:
+            return
+        for target in self._plan.targets:
+            if (
+                len(self._jobs) >= MAX_PREFETCH_JOBS
+                or self.spent >= self.budget
+                or target.offset > horizon
+            ):
+                break
+            key = target.passage.key
+            if (
+                target.offset < offset
+                or key in self._jobs
+                or key in self._done
+            ):
+                continue
+            self._submit(target, *self.book_reader.generation_settings)
+        if self.spent >= self.budget and not self._jobs:
+            self.set_enabled(False)
+            self.budgetExhausted.emit()
+
+    def _submit(
+        self,
+        target: PrefetchTarget,
+        backend: ImagenBackend,
+        generation_params: dict[str, Any],
+    ):
+        key = target.passage.key
+        worker = Worker(
+            generate_passage_image,
+            backend,
+            target.passage,
+            report_progress=backend.reports_progress,
+            **generation_params,
+        )
+        worker.setAutoDelete(False)
+        worker.signals.result.connect(
+            lambda img_data: self._handle_image(key, img_data)
+        )
+        worker.signals.progress.connect(
+            self.book_reader.report_generation_status
+        )
+        self._jobs[key] = (target, worker)
+        self.spent += 1
+        self.book_reader.thread_pool.start(worker, PREFETCH_PRIORITY)
+
+    def _handle_image(self, key: str, img_data: str | None):
+        target, _ = self._jobs.pop(key)
+        self._done.add(key)
+        offset = self._book_offset(self.book_reader.reading_position())
+        # Drop images of passages the reader has already gone past
+        if img_data is not None and target.offset >= offset:
+            passage = target.passage
+            needle = passage.text[:NEEDLE_LENGTH].rsplit(' ', 1)[0]
+            cursor = self.book_reader.find_text(
+                passage.chapter, target.offset_ratio, needle
+            )
+            cursor.movePosition(cursor.MoveOperation.EndOfBlock)
+            self.book_reader.handle_illustration(
+                Illustration(img_data, cursor, truncate_str(passage.text))
+            )
+        self._update()
@@ -1,15 +1,50 @@
+import os
 import re
+import html
+import posixpath
+from urllib.parse import unquote
+from functools import cache
 from typing import Generator, NamedTuple
 
 import ebooklib
 from ebooklib.epub import EpubBook
-from PyQt6.QtGui import QImage, QPixmap
+from PyQt6.QtCore import QDirIterator, QBuffer, QSize, Qt
+from PyQt6.QtGui import (
+    QImage, QImageReader, QPixmap, QFontDatabase, QTextCursor
+)
+
+from br.book import Chapter
+from br.utils import q_iter_dir
+
+
+BUNDLED_FONTS_DIR = ':/fonts/'
+FONT_WEIGHT_NAMES = {
+    200: 'ExtraLight',
+    300: 'Light',
+    400: '',
+    500: 'Medium',
+    600: 'SemiBold',
+    700: 'Bold',
+    800: 'ExtraBold',
+    900: 'Black',
+}
+BOLD_TAGS = ('b', 'strong', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'th')
+ITALIC_TAGS = ('i', 'em', 'cite', 'var', 'dfn', 'address')
+_registered_fonts: set[str] = set()
+
+
+class TocEntry(NamedTuple):
+    title: str
+    href: str | None
+    children: list['TocEntry']
 
 
 class Illustration(NamedTuple):
     img_data: str
-    block_num: int
+    # Stays at the end of the block to illustrate as the document changes
+    cursor: QTextCursor
     caption: str | None = None
+    name: str | None = None
 
 
 def _get_content(book: EpubBook, item_type: int) -> Generator[str, None, None]:
@@ -23,16 +58,125 @@ def get_html_content(book: EpubBook) -> Generator[str, None, None]:
     return _get_content(book, ebooklib.ITEM_DOCUMENT)
 
 
+def resolve_href(base_href: str, href: str) -> tuple[str, str]:
+    path, _, fragment = href.partition('#')
+    if path:
+        path = posixpath.normpath(
+            posixpath.join(posixpath.dirname(base_href), unquote(path))
+        )
+    else:
+        path = base_href
+    return path, fragment
+
+
+def resolve_hrefs(s: str, base_href: str) -> str:
+    def repl(m: re.Match) -> str:
+        href = html.unescape(m.group(3))
+        if re.match(r'[a-zA-Z][\w+.-]*:', href):
+            return m.group()
+        path, fragment = resolve_href(base_href, href)
+        href = f'{path}#{fragment}' if fragment else path
+        return f'{m.group(1)}{m.group(2)}{html.escape(href)}{m.group(2)}'
+
+    return re.sub(r'(\bhref\s*=\s*)(["\'])(.*?)\2', repl, s)
+
+
+def get_anchor_index(chapters: list[Chapter]) -> dict[tuple[str, str], int]:
+    anchor_index = {}
+    for i, chapter in enumerate(chapters):
+        anchor_index[chapter.href, ''] = i
+        for anchor in re.findall(
+            r'\b(?:id|name)\s*=\s*["\']([^"\']+)["\']', chapter.html
+        ):
+            anchor_index.setdefault((chapter.href, anchor), i)
+    return anchor_index
+
+
+def get_toc(book: EpubBook) -> list[TocEntry]:
+    def convert(node) -> TocEntry:
+        if isinstance(node, tuple):
+            section, children = node
+            return TocEntry(
+                section.title,
+                getattr(section, 'href', None) or None,
+                [convert(child) for child in children],
+            )
+        return TocEntry(node.title, getattr(node, 'href', None), [])
+
+    toc = book.toc
+    # ebooklib returns a lone entry instead of a list for some books
+    if not isinstance(toc, (list, tuple)):
+        toc = [toc]
+    return [convert(node) for node in toc]
+
+
 def get_css_content(book: EpubBook) -> Generator[str, None, None]:
     return _get_content(book, ebooklib.ITEM_STYLE)
 
 
-def remove_font_family(s: str) -> str:
-    return re.sub(r'(?<=;|"|\s)font-family[^;]*(;)?', '', s)
+def get_font_variants(book: EpubBook) -> set[tuple[int, bool]]:
+    content = ''.join(
+        list(get_css_content(book)) + list(get_html_content(book))
+    )
+    weights = {400}
+    for value in re.findall(r'font-weight\s*:\s*([\w-]+)', content):
+        if value.isdigit():
+            weights.add(min(max(round(int(value), -2), 200), 900))
+        elif value in ('bold', 'bolder'):
+            weights.add(700)
+        elif value == 'lighter':
+            weights.add(300)
+    if re.search(rf'<({"|".join(BOLD_TAGS)})[\s>]', content):
+        weights.add(700)
+    has_italic = bool(
+        re.search(r'font-style\s*:\s*(italic|oblique)', content)
+        or re.search(rf'<({"|".join(ITALIC_TAGS)})[\s>]', content)
+    )
+    return {
+        (weight, italic)
+        for weight in weights
+        for italic in (False, has_italic)
+    }
+
+
+@cache
+def get_bundled_font_files() -> dict[str, str]:
+    try:
+        import br.resources
+    except ImportError:
+        return {}
+    dir_it = q_iter_dir(
+        BUNDLED_FONTS_DIR,
+        ['*.ttf'],
+        flags=QDirIterator.IteratorFlag.Subdirectories,
+    )
+    return {
+        os.path.splitext(os.path.basename(font_file))[0]: font_file
+        for font_file in dir_it
+    }
+
+
+def get_bundled_font_families() -> list[str]:
+    return list(
+        dict.fromkeys(
+            name.split('-', 1)[0] for name in get_bundled_font_files()
+        )
+    )
 
 
-def truncate_str(s: str, l: int = 79, trun_char: str = '...') -> str:
-    return s[:l - len(trun_char)] + trun_char if len(s) > l else s
+def register_bundled_font(family: str, variants: set[tuple[int, bool]]):
+    font_files = get_bundled_font_files()
+    for weight, italic in variants:
+        style = FONT_WEIGHT_NAMES[weight] + ('Italic' if italic else '')
+        name = f'{family}-{style or "Regular"}'
+        if name in _registered_fonts or name not in font_files:
+            continue
+        QFontDatabase.addApplicationFont(font_files[name])
+        _registered_fonts.add(name)
+
+
+def remove_font_family(s: str) -> str:
+    return re.sub(r'(?<=;|"|\s)font-family[^;]*(;)?', '', s)
 
 
 def scale_to_largest(w: int, h: int, largest_side: int) -> tuple[int, int]:
@@ -42,3 +186,17 @@ def scale_to_largest(w: int, h: int, largest_side: int) -> tuple[int, int]:
         scale = largest_side / h
     return int(w * scale), int(h * scale)
 
+
+def load_thumbnail(img_data: bytes | None, size: QSize) -> QImage:
+    if not img_data:
+        return QImage()
+    buffer = QBuffer()
+    buffer.setData(img_data)
+    reader = QImageReader(buffer)
+    img_size = reader.size()
+    if img_size.isValid():
+        # Lets decoders like JPEG skip most of the work for large covers
+        reader.setScaledSize(
+            img_size.scaled(size, Qt.AspectRatioMode.KeepAspectRatio)
+        )
+    return reader.read()
@@ -1,12 +1,15 @@
 import os
 import html
+import json
+from bisect import bisect_right
+from math import ceil
 from uuid import uuid4
-from hashlib import file_digest
+from urllib.parse import unquote
+from hashlib import file_digest, md5
 from zipfile import ZipFile
 from base64 import b64decode
 from abc import ABCMeta, ABC, abstractmethod
 from typing import Iterable, Any
-from functools import partial
 
 from PyQt6.QtWidgets import (
     QTextBrowser,
@@ -21,13 +24,28 @@ from PyQt6.QtWidgets import (
     QWidget,
     QSlider,
     QSpinBox,
+    QCheckBox,
     QTabWidget,
     QApplication,
     QLabel,
     QStackedLayout,
+    QLineEdit,
+    QListWidget,
+    QListWidgetItem,
+    QTreeWidget,
+    QTreeWidgetItem,
 )
 from PyQt6.QtCore import (
-    QTemporaryDir, QUrl, Qt, QThreadPool, QObject, pyqtSignal
+    QTemporaryDir,
+    QUrl,
+    Qt,
+    QThreadPool,
+    QObject,
+    QTimer,
+    QPoint,
+    QSize,
+    QSettings,
+    pyqtSignal,
 )
 from PyQt6.QtGui import (
     QTextCursor,
@@ -35,30 +53,61 @@ from PyQt6.QtGui import (
     QContextMenuEvent,
     QAction,
     QPixmap,
-    QTextDocument,
+    QIcon,
+    QImage,
     QTextImageFormat,
     QFont,
+    QFontDatabase,
+    QKeyEvent,
+    QWheelEvent,
+    QPaintEvent,
+    QResizeEvent,
+    QShowEvent,
+    QPainter,
+    QTextFrame,
+    QTextFrameFormat,
 )
 from ebooklib import epub
 
 from br.ui.utils import (
     get_css_content,
-    get_html_content,
     remove_font_family,
-    truncate_str,
     Illustration,
+    TocEntry,
+    get_anchor_index,
+    get_toc,
+    resolve_hrefs,
     scale_to_largest,
+    get_font_variants,
+    get_bundled_font_families,
+    register_bundled_font,
+    load_thumbnail,
 )
+from br.book import Chapter, get_chapters, truncate_str
+from br.imagen import NEG_PROMPT
 from br.imagen.backends import (
-    SdWebUIBackend, GenerationParamType, OpenAIBackend
+    GenerationParamType, ImagenBackend, available_backends, create_backend
 )
-from br.imagen.backends.base import ImagenBackend
 from br.ui.multithreading import Worker
+from br.ui.illustrations import IllustrationStore
+from br.utils import get_cache_dir
+from br.search import SearchIndex, SearchHit, build_search_index
+from br.library import BookInfo, read_cover
 
 
 CAPTION_TEMPLATE = '<br><i><small>{}</small></i>'
 ILL_MAX_DIM = 768
-NEG_PROMPT = """lowres, text, error, cropped, worst quality, low quality, jpeg artifacts, ugly, duplicate, morbid, mutilated, out of frame, extra fingers, mutated hands, poorly drawn hands, poorly drawn face, mutation, deformed, blurry, bad anatomy, bad proportions, extra limbs, cloned face, disfigured, gross proportions, malformed limbs, missing arms, missing legs, extra arms, extra legs, fused fingers, too many fingers, long neck, username, watermark, signature"""
+FONT_CHANGE_DELAY_MS = 200
+REPAGINATE_DELAY_MS = 300
+SAVE_POSITION_DELAY_MS = 1000
+SEARCH_SLACK = 500
+MAX_SEARCH_HITS = 1000
+THUMBNAIL_SIZE = QSize(120, 180)
+THUMBNAIL_DELAY_MS = 100
+NEXT_PAGE_KEYS = (
+    Qt.Key.Key_PageDown, Qt.Key.Key_Space, Qt.Key.Key_Right, Qt.Key.Key_Down
+)
+PREV_PAGE_KEYS = (Qt.Key.Key_PageUp, Qt.Key.Key_Left, Qt.Key.Key_Up)
 
 
 class QMeta(ABCMeta, type(QObject)):
@@ -119,12 +168,22 @@ class IntNumberParam(GenerationParamMixin, QWidget, metaclass=QMeta):
         return self.spin_box.value()
 
 
+class CheckBoxParam(GenerationParamMixin, QCheckBox, metaclass=QMeta):
+    def __init__(self, *args, init_value: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setChecked(init_value)
+
+    def param_value(self) -> bool:
+        return self.isChecked()
+
+
 class GenerationParamsBox(QGroupBox):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._param_type2widget = {
             GenerationParamType.COMBO_BOX: ComboBoxParam,
             GenerationParamType.INT_NUMBER: IntNumberParam,
+            GenerationParamType.CHECK_BOX: CheckBoxParam,
         }
         self._label2row_num = {}
 
@@ -159,21 +218,22 @@ class PromptEditor(QPlainTextEdit):
 
 
 class GIDialog(QDialog):
-    def __init__(self, pos_prompt: str, neg_prompt: str, *args, **kwargs):
+    def __init__(
+        self,
+        pos_prompt: str,
+        neg_prompt: str,
+        *args,
+        job_owner: str | None = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
+        self._job_owner = job_owner
         self.setWindowTitle(
             f'{QApplication.applicationName()} - Configure Illustration'
         )
-        self._backend_factory = {
-            'Stable Diffusion WebUI': partial(
-                SdWebUIBackend,
-                os.environ['SD_WEB_UI_API_HOST'],
-                int(os.environ['SD_WEB_UI_API_PORT']),
-            ),
-            'OpenAI': OpenAIBackend,
-        }
+        self._backend_names = list(available_backends())
         self._backends: list[ImagenBackend | None] = [
-            None for _ in self._backend_factory
+            None for _ in self._backend_names
         ]
 
         main_layout = QVBoxLayout()
@@ -184,7 +244,7 @@ class GIDialog(QDialog):
 
         left_panel_layout.addWidget(QLabel('Backend'))
         self.backend_cbox = QComboBox()
-        self.backend_cbox.addItems(self._backend_factory)
+        self.backend_cbox.addItems(self._backend_names)
         self.backend_cbox.currentIndexChanged.connect(
             self._on_backend_cbox_change
         )
@@ -249,7 +309,9 @@ class GIDialog(QDialog):
     def _on_backend_cbox_change(self, idx: int):
         backend = self._backends[idx] 
         if backend is None:
-            backend = self._backend_factory[self.backend_cbox.currentText()]()
+            backend = create_backend(
+                self._backend_names[idx], self._job_owner
+            )
             self._backends[idx] = backend
             gen_params_box = GenerationParamsBox('Generation Parameters')
             for param in backend.generation_params.values():
@@ -265,11 +327,58 @@ class GIDialog(QDialog):
 
 
 class BookReader(QTextBrowser):
+    pageChanged = pyqtSignal(int, int)
+    chaptersLoaded = pyqtSignal()
+    generationStatusChanged = pyqtSignal(str)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.book = None
+        self.book_hash = None
         self.extract_dir = None
+        # Identifies this book to a shared illustration service
+        self.job_owner = uuid4().hex
+        self._chapters: list[Chapter] = []
+        self._chapter_frames: list[QTextFrame] = []
+        self._chapter_weights: list[float] = []
+        self._anchor_index: dict[tuple[str, str], int] = {}
+        self._anchor_offsets: dict[tuple[str, str], int] = {}
+        self._load_queue: list[int] = []
+        self._paginated = False
+        self._page_starts: list[int] = []
+        self._page_geometry: tuple[int, int] | None = None
+        self._page = 0
+        self._modified = False
+        self._pending_anchor: QTextCursor | None = None
+        self._font_variants = {(400, False)}
+        self._pending_font: QFont | None = None
+        self._font_timer = QTimer(self)
+        self._font_timer.setSingleShot(True)
+        self._font_timer.setInterval(FONT_CHANGE_DELAY_MS)
+        self._font_timer.timeout.connect(self._apply_pending_font)
+        self._repaginate_timer = QTimer(self)
+        self._repaginate_timer.setSingleShot(True)
+        self._repaginate_timer.setInterval(REPAGINATE_DELAY_MS)
+        self._repaginate_timer.timeout.connect(self._repaginate)
+        self._load_timer = QTimer(self)
+        self._load_timer.timeout.connect(self._load_next_chapter)
+        self._save_position_timer = QTimer(self)
+        self._save_position_timer.setSingleShot(True)
+        self._save_position_timer.setInterval(SAVE_POSITION_DELAY_MS)
+        self._save_position_timer.timeout.connect(self.save_position)
         self.thread_pool = QThreadPool(self)
+        # Refinements are queued one at a time, so discarding a draft
+        # before its turn costs nothing
+        self.refine_pool = QThreadPool(self)
+        self.refine_pool.setMaxThreadCount(1)
+        self.illustrations: IllustrationStore | None = None
+        self._placeholder_pixmap = QPixmap(1, 1)
+        self._painting = False
+        self._illustrations: dict[str, QTextCursor] = {}
+        self._refines: dict[str, Worker] = {}
+        self.generation_settings: (
+            tuple[ImagenBackend, dict[str, Any]] | None
+        ) = None
 
         self.gi_action = QAction('Generate Illustration', self)
         self.gi_action.setEnabled(False)
@@ -282,9 +391,13 @@ class BookReader(QTextBrowser):
 
         self.anchorClicked.connect(self.scroll_to_anchor)
         self.copyAvailable.connect(self.gi_action.setEnabled)
+        self.verticalScrollBar().valueChanged.connect(
+            lambda: self._save_position_timer.start()
+        )
 
     def _modify_block_format(
         self,
+        frame: QTextFrame,
         line_height: float | None = None,
         text_indent: float | None = None,
     ):
@@ -297,41 +410,299 @@ class BookReader(QTextBrowser):
             )
         if text_indent is not None:
             block_fmt.setTextIndent(text_indent)
-        cursor = self.textCursor()
-        cursor.clearSelection()
-        cursor.select(QTextCursor.SelectionType.Document)
+        cursor = frame.firstCursorPosition()
+        cursor.setPosition(
+            frame.lastPosition(), QTextCursor.MoveMode.KeepAnchor
+        )
         cursor.mergeBlockFormat(block_fmt)
-        cursor.clearSelection()
-
-    def _move_cursor_to_block_n(self, n: int) -> QTextCursor:
-        cursor = QTextCursor(self.document().findBlockByNumber(n))
-        self.setTextCursor(cursor)
-        return cursor
 
     def load_book(self, book_path: str, ext_base_dir: str | None):
         self.book = epub.read_epub(book_path)
         if ext_base_dir is None:
             ext_base_dir = QTemporaryDir().path()
         with open(book_path, 'rb') as f:
-            book_hash = file_digest(f, 'md5').hexdigest()
-            self.extract_dir = os.path.join(ext_base_dir, book_hash)
+            self.book_hash = file_digest(f, 'md5').hexdigest()
+            self.extract_dir = os.path.join(ext_base_dir, self.book_hash)
             with ZipFile(f) as zip:
                 zip.extractall(self.extract_dir)
         self.setSearchPaths([self.extract_dir])
+        self.illustrations = IllustrationStore(
+            os.path.join(ext_base_dir, f'{self.book_hash}-illustrations')
+        )
+        # PyQt does not keep a reference to the provider
+        self._resource_provider = self._load_resource
+        self.document().setResourceProvider(self._resource_provider)
+        self._font_variants = get_font_variants(self.book)
         self.document().setDefaultStyleSheet(
             remove_font_family(''.join(list(get_css_content(self.book))))
         )
-        self.setHtml(
-            remove_font_family(''.join(list(get_html_content(self.book))))
+        self._chapters = get_chapters(self.book)
+        total_length = sum(len(ch.html) for ch in self._chapters) or 1
+        self._chapter_weights = [
+            len(ch.html) / total_length for ch in self._chapters
+        ]
+        self._anchor_index = get_anchor_index(self._chapters)
+        self._anchor_offsets = {}
+        self._create_chapter_frames()
+        chapter_idx, offset = self._read_saved_position()
+        self._load_chapter(chapter_idx)
+        self.scroll_to_position(self.locator_to_position(chapter_idx, offset))
+        self._load_queue = sorted(
+            (i for i in range(len(self._chapters)) if i != chapter_idx),
+            key=lambda i: (abs(i - chapter_idx), i < chapter_idx),
+        )
+        self._load_timer.start()
+
+    def _create_chapter_frames(self):
+        self.document().clear()
+        self._chapter_frames = []
+        cursor = QTextCursor(self.document())
+        for _ in self._chapters:
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            self._chapter_frames.append(cursor.insertFrame(QTextFrameFormat()))
+
+    def _load_chapter(self, idx: int):
+        chapter = self._chapters[idx]
+        frame = self._chapter_frames[idx]
+        cursor = frame.firstCursorPosition()
+        cursor.insertHtml(
+            resolve_hrefs(remove_font_family(chapter.html), chapter.href)
+        )
+        self._modify_block_format(frame, 150, 50)
+        self._index_chapter_anchors(idx)
+
+    def _index_chapter_anchors(self, idx: int):
+        href = self._chapters[idx].href
+        frame = self._chapter_frames[idx]
+        first_pos = frame.firstPosition()
+        block = self.document().findBlock(first_pos)
+        while block.isValid() and block.position() <= frame.lastPosition():
+            it = block.begin()
+            while not it.atEnd():
+                fragment = it.fragment()
+                for name in fragment.charFormat().anchorNames():
+                    self._anchor_offsets.setdefault(
+                        (href, name), fragment.position() - first_pos
+                    )
+                it += 1
+            block = block.next()
+
+    def _load_next_chapter(self):
+        if not self._load_queue:
+            self._load_timer.stop()
+            self.chaptersLoaded.emit()
+            return
+        idx = self._load_queue.pop(0)
+        anchor = QTextCursor(self.document())
+        anchor.setPosition(self.reading_position())
+        self._load_chapter(idx)
+        if self._chapter_frames[idx].lastPosition() < anchor.position():
+            self.scroll_to_position(anchor.position())
+
+    def load_all_chapters(self):
+        if not self._load_queue:
+            return
+        for idx in self._load_queue:
+            self._load_chapter(idx)
+        self._load_queue.clear()
+        self._load_timer.stop()
+        self.chaptersLoaded.emit()
+
+    @property
+    def chapters_loaded(self) -> bool:
+        return not self._load_queue
+
+    @property
+    def chapters(self) -> list[Chapter]:
+        return self._chapters
+
+    def ensure_chapter_loaded(self, idx: int):
+        if idx not in self._load_queue:
+            return
+        anchor = QTextCursor(self.document())
+        anchor.setPosition(self.reading_position())
+        self._load_queue.remove(idx)
+        self._load_chapter(idx)
+        if self._chapter_frames[idx].lastPosition() < anchor.position():
+            self.scroll_to_position(anchor.position())
+
+    def go_to_position(self, pos: int):
+        if self._paginated:
+            self.go_to_page(self.page_for_position(pos))
+        else:
+            self.scroll_to_position(pos)
+
+    def find_text(
+        self,
+        chapter_idx: int,
+        offset_ratio: float,
+        text: str,
+        occurrence: int | None = None,
+    ) -> QTextCursor:
+        self.ensure_chapter_loaded(chapter_idx)
+        frame = self._chapter_frames[chapter_idx]
+        first_pos, last_pos = frame.firstPosition(), frame.lastPosition()
+        if occurrence is not None:
+            cursor = QTextCursor(self.document())
+            cursor.setPosition(first_pos)
+            for _ in range(occurrence + 1):
+                cursor = self.document().find(text, cursor)
+                if cursor.isNull() or cursor.selectionEnd() > last_pos:
+                    break
+            else:
+                return cursor
+        approx_pos = first_pos + round((last_pos - first_pos) * offset_ratio)
+        for from_pos in (max(approx_pos - SEARCH_SLACK, first_pos), first_pos):
+            cursor = self.document().find(text, from_pos)
+            if not cursor.isNull() and cursor.selectionEnd() <= last_pos:
+                return cursor
+        cursor = QTextCursor(self.document())
+        cursor.setPosition(approx_pos)
+        return cursor
+
+    def go_to_text(
+        self,
+        chapter_idx: int,
+        offset_ratio: float,
+        text: str,
+        occurrence: int | None = None,
+    ) -> bool:
+        cursor = self.find_text(chapter_idx, offset_ratio, text, occurrence)
+        if not cursor.hasSelection():
+            self.go_to_position(cursor.position())
+            return False
+        self.setTextCursor(cursor)
+        self.go_to_position(cursor.selectionStart())
+        return True
+
+    def position_to_locator(self, pos: int) -> tuple[int, int]:
+        first_positions = [f.firstPosition() for f in self._chapter_frames]
+        chapter_idx = max(bisect_right(first_positions, pos) - 1, 0)
+        return chapter_idx, max(pos - first_positions[chapter_idx], 0)
+
+    def locator_to_position(self, chapter_idx: int, offset: int) -> int:
+        frame = self._chapter_frames[chapter_idx]
+        return min(frame.firstPosition() + offset, frame.lastPosition())
+
+    def position_to_ratio(self, pos: int) -> tuple[int, float]:
+        chapter_idx, offset = self.position_to_locator(pos)
+        frame = self._chapter_frames[chapter_idx]
+        chapter_length = frame.lastPosition() - frame.firstPosition() or 1
+        return chapter_idx, min(offset / chapter_length, 1.0)
+
+    def progress(self) -> float:
+        if not self._chapter_frames:
+            return 0.0
+        chapter_idx, offset_ratio = self.position_to_ratio(
+            self.reading_position()
+        )
+        return (
+            sum(self._chapter_weights[:chapter_idx])
+            + self._chapter_weights[chapter_idx] * offset_ratio
+        )
+
+    def _read_saved_position(self) -> tuple[int, int]:
+        value = QSettings().value(f'positions/{self.book_hash}')
+        try:
+            href, offset = json.loads(value)
+        except (TypeError, ValueError):
+            return 0, 0
+        for i, chapter in enumerate(self._chapters):
+            if chapter.href == href:
+                return i, int(offset)
+        return 0, 0
+
+    def save_position(self):
+        if self.book_hash is None or not self._chapters:
+            return
+        chapter_idx, offset = self.position_to_locator(
+            self.reading_position()
+        )
+        QSettings().setValue(
+            f'positions/{self.book_hash}',
+            json.dumps([self._chapters[chapter_idx].href, offset]),
         )
-        self._modify_block_format(150, 50)
 
     def scroll_to_anchor(self, url: QUrl):
+        self.navigate(url.toString())
+
+    def navigate(self, href: str) -> bool:
+        path, _, fragment = href.partition('#')
+        key = (unquote(path), fragment)
+        chapter_idx = self._anchor_index.get(key)
+        if chapter_idx is None:
+            return False
+        self.ensure_chapter_loaded(chapter_idx)
+        self.go_to_position(
+            self._chapter_frames[chapter_idx].firstPosition()
+            + self._anchor_offsets.get(key, 0)
+        )
+        return True
+
+    def _load_resource(self, url: QUrl) -> QPixmap | None:
+        name = url.fileName()
+        if name not in self.illustrations:
+            return None
+        # Layout only checks that the image exists, its size is set in the
+        # format, so illustrations are decoded only when they are painted
+        if not self._painting:
+            return self._placeholder_pixmap
+        return self.illustrations.pixmap(name)
+
+    def paintEvent(self, e: QPaintEvent | None):
+        self._painting = True
         try:
-            _, anchor = url.url().rsplit('#', 1)
-        except ValueError:
-            return 
-        self.scrollToAnchor(anchor)
+            super().paintEvent(e)
+        finally:
+            self._painting = False
+        if not self._paginated or self._page + 1 >= self.page_count:
+            return
+        # Hide the partially visible first line of the next page
+        page_bottom = round(
+            self._get_position_y(self._page_starts[self._page + 1])
+            - self.verticalScrollBar().value()
+        )
+        viewport_rect = self.viewport().rect()
+        if page_bottom < viewport_rect.bottom():
+            viewport_rect.setTop(page_bottom)
+            painter = QPainter(self.viewport())
+            painter.fillRect(viewport_rect, self.palette().base())
+
+    def showEvent(self, e: QShowEvent | None):
+        super().showEvent(e)
+        if self._pending_anchor is not None:
+            anchor, self._pending_anchor = self._pending_anchor, None
+            self.scroll_to_position(anchor.position())
+
+    def resizeEvent(self, e: QResizeEvent | None):
+        anchor = self.reading_position()
+        super().resizeEvent(e)
+        if self._paginated:
+            if self._get_page_geometry() != self._page_geometry:
+                self._repaginate_timer.start()
+        elif (
+            self._pending_anchor is None
+            and e.oldSize().width() != e.size().width()
+        ):
+            self.scroll_to_position(anchor)
+
+    def wheelEvent(self, e: QWheelEvent | None):
+        if not self._paginated:
+            return super().wheelEvent(e)
+        delta = e.angleDelta().y()
+        if delta < 0:
+            self.next_page()
+        elif delta > 0:
+            self.prev_page()
+        e.accept()
+
+    def keyPressEvent(self, e: QKeyEvent | None):
+        if self._paginated and e.key() in NEXT_PAGE_KEYS:
+            self.next_page()
+        elif self._paginated and e.key() in PREV_PAGE_KEYS:
+            self.prev_page()
+        else:
+            super().keyPressEvent(e)
 
     def contextMenuEvent(self, e: QContextMenuEvent | None) -> None:
         scroll_pos = e.pos()
@@ -339,6 +710,14 @@ class BookReader(QTextBrowser):
         scroll_pos.setY(scroll_pos.y() + self.verticalScrollBar().value())
         menu = self.createStandardContextMenu(scroll_pos)
         menu.addAction(self.gi_action)
+        block = self.cursorForPosition(e.pos()).block()
+        for name, ill_cursor in self._illustrations.items():
+            if ill_cursor.block() == block:
+                discard_action = menu.addAction('Discard Illustration')
+                discard_action.triggered.connect(
+                    lambda: self.discard_illustration(name)
+                )
+                break
         menu.exec(e.globalPos())
 
     def insert_illustration(
@@ -348,7 +727,7 @@ class BookReader(QTextBrowser):
         width: float | None = None,
         height: float | None = None,
         caption: str | None = None,
-    ):
+    ) -> int:
         cursor = self.textCursor()
         cursor.beginEditBlock()
         cursor.setPosition(pos)
@@ -357,6 +736,7 @@ class BookReader(QTextBrowser):
         block_fmt.setTopMargin(20)
         block_fmt.setBottomMargin(20)
         cursor.insertBlock(block_fmt)
+        img_pos = cursor.position()
         ill_fmt = QTextImageFormat()
         ill_fmt.setName(name.url())
         if width and height:
@@ -366,57 +746,330 @@ class BookReader(QTextBrowser):
         if caption:
             cursor.insertHtml(CAPTION_TEMPLATE.format(html.escape(caption)))
         cursor.endEditBlock()
+        return img_pos
 
-    def handle_illustration(self, ill: Illustration):
-        img = QPixmap()
-        img_data = b64decode(ill.img_data)
-        img.loadFromData(img_data)
-        with open('test.png', 'wb') as f:
-            f.write(img_data)
-        img_id = QUrl(uuid4().hex)
-        self.document().addResource(
-            QTextDocument.ResourceType.ImageResource.value, img_id, img
-        )
-        ill_w, ill_h = img.width(), img.height()
+    def _add_illustration_resource(
+        self, name: QUrl, img_data: str
+    ) -> tuple[float, float]:
+        size = self.illustrations.add(name.url(), b64decode(img_data))
+        ill_w, ill_h = size.width(), size.height()
         if ill_w > ILL_MAX_DIM or ill_h > ILL_MAX_DIM:
             ill_w, ill_h = scale_to_largest(ill_w, ill_h, ILL_MAX_DIM)
-        self.textCursor().clearSelection()
-        cursor = self._move_cursor_to_block_n(ill.block_num)
+        return ill_w, ill_h
+
+    def handle_illustration(self, ill: Illustration):
+        name = ill.name or uuid4().hex
+        if name in self._illustrations:
+            self.replace_illustration(name, ill.img_data)
+            return
+        img_id = QUrl(name)
+        ill_w, ill_h = self._add_illustration_resource(img_id, ill.img_data)
+        anchor = QTextCursor(self.document())
+        anchor.setPosition(self.reading_position())
+        cursor = QTextCursor(ill.cursor)
         cursor.movePosition(cursor.MoveOperation.EndOfBlock)
-        self.insert_illustration(
-            img_id, cursor.position(), ill_w, ill_h, ill.caption
+        pos = cursor.position()
+        img_pos = self.insert_illustration(
+            img_id, pos, ill_w, ill_h, ill.caption
+        )
+        self._illustrations[name] = QTextCursor(self.document())
+        self._illustrations[name].setPosition(img_pos)
+        self._modified = True
+        if self._paginated:
+            self._repaginate()
+        elif pos < anchor.position():
+            self.scroll_to_position(anchor.position())
+
+    def replace_illustration(self, name: str, img_data: str):
+        ill_w, ill_h = self._add_illustration_resource(QUrl(name), img_data)
+        anchor = QTextCursor(self.document())
+        anchor.setPosition(self.reading_position())
+        cursor = QTextCursor(self._illustrations[name])
+        cursor.movePosition(
+            cursor.MoveOperation.NextCharacter, cursor.MoveMode.KeepAnchor
+        )
+        ill_fmt = cursor.charFormat().toImageFormat()
+        ill_fmt.setWidth(ill_w)
+        ill_fmt.setHeight(ill_h)
+        cursor.setCharFormat(ill_fmt)
+        self.document().markContentsDirty(cursor.selectionStart(), 1)
+        if self._paginated:
+            self._repaginate()
+        elif cursor.position() < anchor.position():
+            self.scroll_to_position(anchor.position())
+
+    def discard_illustration(self, name: str):
+        worker = self._refines.pop(name, None)
+        if worker is not None:
+            self.refine_pool.tryTake(worker)
+        anchor = QTextCursor(self.document())
+        anchor.setPosition(self.reading_position())
+        cursor = self._illustrations.pop(name)
+        cursor.select(cursor.SelectionType.BlockUnderCursor)
+        cursor.removeSelectedText()
+        self.illustrations.remove(name)
+        if self._paginated:
+            self._repaginate()
+        else:
+            self.scroll_to_position(anchor.position())
+
+    def _handle_draft(
+        self,
+        ill: Illustration,
+        backend: ImagenBackend,
+        draft: tuple[str, int],
+        **generation_params,
+    ):
+        img_data, seed = draft
+        self.handle_illustration(ill._replace(img_data=img_data))
+        worker = Worker(
+            backend.refine_image,
+            img_data,
+            seed=seed,
+            report_progress=backend.reports_progress,
+            **generation_params,
+        )
+        worker.setAutoDelete(False)
+        worker.signals.result.connect(
+            lambda img_data: self._handle_refined(ill.name, img_data)
         )
+        worker.signals.progress.connect(self.report_generation_status)
+        self._refines[ill.name] = worker
+        self.refine_pool.start(worker)
+
+    def _handle_refined(self, name: str, img_data: str):
+        self._refines.pop(name, None)
+        if name in self._illustrations:
+            self.replace_illustration(name, img_data)
+
+    def report_generation_status(self, status: dict[str, Any]):
+        if status['state'] == 'queued':
+            message = f'Illustration queued, {status["ahead"]} jobs ahead'
+        else:
+            message = 'Generating illustration...'
+        self.generationStatusChanged.emit(message)
 
     def open_gi_dialog(self):
         cursor = self.textCursor()
         if not cursor.hasSelection():
             return
-        dlg = GIDialog(cursor.selectedText(), NEG_PROMPT, self)
+        # Chapters and other illustrations may be inserted above the
+        # selection while the image is generated
+        block_end = QTextCursor(cursor)
+        block_end.movePosition(block_end.MoveOperation.EndOfBlock)
+        dlg = GIDialog(
+            cursor.selectedText(), NEG_PROMPT, self, job_owner=self.job_owner
+        )
         if dlg.exec() == GIDialog.DialogCode.Accepted:
-            def generate_illustration(*args, **kwargs) -> Illustration:
-                return Illustration(
-                    dlg.backend.generate_image(*args, **kwargs),
-                    cursor.blockNumber(),
-                    truncate_str(cursor.selectedText()),
-                )
-            worker = Worker(
-                generate_illustration,
-                pos_prompt=dlg.pos_prompt,
-                neg_prompt=dlg.neg_prompt,
-                **dlg.generation_params,
+            backend = dlg.backend
+            generation_params = dlg.generation_params
+            progressive = generation_params.pop('progressive', False)
+            self.generation_settings = (backend, generation_params)
+            ill = Illustration(
+                '',
+                block_end,
+                truncate_str(cursor.selectedText()),
+                uuid4().hex,
             )
-            worker.signals.result.connect(self.handle_illustration)
+            prompts = {
+                'pos_prompt': dlg.pos_prompt, 'neg_prompt': dlg.neg_prompt
+            }
+            if progressive and backend.supports_drafts:
+                worker = Worker(
+                    backend.generate_draft,
+                    report_progress=backend.reports_progress,
+                    **prompts,
+                    **generation_params,
+                )
+                worker.signals.result.connect(
+                    lambda draft: self._handle_draft(
+                        ill, backend, draft, **prompts, **generation_params
+                    )
+                )
+            else:
+                worker = Worker(
+                    backend.generate_image,
+                    report_progress=backend.reports_progress,
+                    **prompts,
+                    **generation_params,
+                )
+                worker.signals.result.connect(
+                    lambda img_data: self.handle_illustration(
+                        ill._replace(img_data=img_data)
+                    )
+                )
+            worker.signals.progress.connect(self.report_generation_status)
             self.thread_pool.start(worker)
 
-    def set_font(self, new_font: QFont):
+    def visible_position(self) -> int:
+        # Probe just below the top edge, so a line that ends exactly at the
+        # edge is not picked
+        cursor = self.cursorForPosition(
+            QPoint(self.viewport().width() // 2, 1)
+        )
+        cursor.movePosition(QTextCursor.MoveOperation.StartOfLine)
+        return cursor.position()
+
+    def reading_position(self) -> int:
+        if self._pending_anchor is not None:
+            return self._pending_anchor.position()
+        return self.visible_position()
+
+    def scroll_to_position(self, pos: int):
+        if not self.document().findBlock(pos).isValid():
+            return
+        if not self.isVisible():
+            # The document is not laid out until the widget is shown
+            self._pending_anchor = QTextCursor(self.document())
+            self._pending_anchor.setPosition(pos)
+            return
+        # Only lays the document out up to the target block, the rest is
+        # laid out incrementally by QTextDocumentLayout in idle time
+        y = ceil(self._get_position_y(pos))
+        scroll_bar = self.verticalScrollBar()
+        # The scroll range is adjusted to the new document size only after
+        # the event loop runs, so it may not cover the target yet
+        if y > scroll_bar.maximum():
+            scroll_bar.setMaximum(y)
+        scroll_bar.setValue(y)
+
+    def _apply_pending_font(self):
+        if self._pending_font is None:
+            return
+        anchor = self.reading_position()
+        self.setFont(self._pending_font)
+        self._pending_font = None
+        if self._paginated:
+            self._repaginate(anchor)
+        else:
+            self.scroll_to_position(anchor)
+
+    def _schedule_font(self, font: QFont):
+        self._pending_font = font
+        if self.isVisible():
+            self._font_timer.start()
+        else:
+            self._apply_pending_font()
+
+    @property
+    def paginated(self) -> bool:
+        return self._paginated
+
+    @property
+    def page(self) -> int:
+        return self._page
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_starts)
+
+    def _get_page_geometry(self) -> tuple[int, int]:
+        rect = self.contentsRect()
+        return rect.width(), rect.height()
+
+    def _get_page_table_path(self) -> str:
         font = self.font()
+        key = (
+            font.family(), font.pointSize(), *self._get_page_geometry()
+        )
+        return os.path.join(
+            get_cache_dir(self.book_hash, 'pages'),
+            f'{md5(repr(key).encode()).hexdigest()}.json',
+        )
+
+    def _compute_page_starts(self) -> list[int]:
+        page_height = self._get_page_geometry()[1]
+        doc_layout = self.document().documentLayout()
+        page_starts = [0]
+        page_top = 0.0
+        block = self.document().begin()
+        while block.isValid():
+            block_top = doc_layout.blockBoundingRect(block).top()
+            layout = block.layout()
+            for i in range(layout.lineCount()):
+                line = layout.lineAt(i)
+                line_top = block_top + line.y()
+                if line_top + line.height() - page_top > page_height:
+                    page_starts.append(block.position() + line.textStart())
+                    page_top = line_top
+            block = block.next()
+        return page_starts
+
+    def _load_page_starts(self) -> list[int]:
+        if self._modified or self.book_hash is None:
+            return self._compute_page_starts()
+        page_table_path = self._get_page_table_path()
+        try:
+            with open(page_table_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        page_starts = self._compute_page_starts()
+        with open(page_table_path, 'w') as f:
+            json.dump(page_starts, f)
+        return page_starts
+
+    def _repaginate(self, anchor: int | None = None):
+        if anchor is None:
+            anchor = self._get_page_start(self._page)
+        self._page_geometry = self._get_page_geometry()
+        self._page_starts = self._load_page_starts()
+        self.go_to_page(self.page_for_position(anchor))
+
+    def _get_page_start(self, page: int) -> int:
+        if not self._page_starts:
+            return 0
+        return self._page_starts[min(page, len(self._page_starts) - 1)]
+
+    def _get_position_y(self, pos: int) -> float:
+        block = self.document().findBlock(pos)
+        y = self.document().documentLayout().blockBoundingRect(block).top()
+        line = block.layout().lineForTextPosition(pos - block.position())
+        if line.isValid():
+            y += line.y()
+        return y
+
+    def page_for_position(self, pos: int) -> int:
+        return max(bisect_right(self._page_starts, pos) - 1, 0)
+
+    def set_paginated(self, enabled: bool):
+        if enabled == self._paginated:
+            return
+        if enabled:
+            self._paginated = True
+            # Page tables are computed over the whole document
+            anchor = QTextCursor(self.document())
+            anchor.setPosition(self.reading_position())
+            self.load_all_chapters()
+            self._repaginate(anchor.position())
+        else:
+            self._paginated = False
+            self.viewport().update()
+            self.scroll_to_position(self._get_page_start(self._page))
+
+    def go_to_page(self, page: int):
+        page = min(max(page, 0), self.page_count - 1)
+        self._page = page
+        self.scroll_to_position(self._page_starts[page])
+        self.viewport().update()
+        self.pageChanged.emit(page, self.page_count)
+
+    def next_page(self):
+        self.go_to_page(self._page + 1)
+
+    def prev_page(self):
+        self.go_to_page(self._page - 1)
+
+    def set_font(self, new_font: QFont):
+        register_bundled_font(new_font.family(), self._font_variants)
+        font = QFont(self._pending_font or self.font())
         font.setFamily(new_font.family())
-        self.setFont(font)
+        self._schedule_font(font)
 
     def set_font_pt_size(self, new_size: int):
-        font = self.font()
+        font = QFont(self._pending_font or self.font())
         font.setPointSize(new_size)
-        self.setFont(font)
+        self._schedule_font(font)
 
 
 class DecoratedLabel(QLabel):
@@ -474,3 +1127,212 @@ class DecoratedComboBox(QComboBox):
             text.removeprefix(self._prefix).removesuffix(self._suffix)
         )
 
+
+
+class FontComboBox(QComboBox):
+    currentFontChanged = pyqtSignal(QFont)
+
+    def __init__(self, init_family: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._populated = False
+        self.addItem(init_family)
+        self.currentTextChanged.connect(self.on_current_text_changed)
+
+    @property
+    def populated(self) -> bool:
+        return self._populated
+
+    def populate(self):
+        if self._populated:
+            return
+        current_family = self.currentText()
+        families = get_bundled_font_families() + [
+            family
+            for family in QFontDatabase.families()
+            if QFontDatabase.isScalable(family)
+        ]
+        self.blockSignals(True)
+        self.clear()
+        self.addItems(sorted(dict.fromkeys(families + [current_family])))
+        self.setCurrentText(current_family)
+        self.blockSignals(False)
+        self._populated = True
+
+    def on_current_text_changed(self, text: str):
+        self.currentFontChanged.emit(QFont(text))
+
+
+class SearchPanel(QWidget):
+    def __init__(self, book_reader: BookReader, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.book_reader = book_reader
+        self._index = SearchIndex()
+        self._query = ''
+        self._chapter_count = len(book_reader.chapters)
+
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText('Search (words, "phrase", prefix*)')
+        self.query_edit.returnPressed.connect(self.search)
+        self.status_label = QLabel()
+        self.results_list = QListWidget()
+        self.results_list.setWordWrap(True)
+        self.results_list.itemActivated.connect(self._on_item_activated)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.query_edit)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.results_list)
+        self.setLayout(layout)
+
+        worker = Worker(
+            build_search_index,
+            [chapter.html for chapter in book_reader.chapters],
+            os.path.join(
+                get_cache_dir(book_reader.book_hash), 'search_index.json'
+            ),
+            report_progress=True,
+        )
+        worker.signals.progress.connect(self._on_chapter_indexed)
+        book_reader.thread_pool.start(worker)
+        self._update_status()
+
+    def _update_status(self):
+        status = f'{self.results_list.count()} results'
+        if self._index.chapter_count < self._chapter_count:
+            status += (
+                f' (indexing {self._index.chapter_count}'
+                f'/{self._chapter_count})'
+            )
+        self.status_label.setText(status)
+
+    def _add_hits(self, hits: list[SearchHit]):
+        for hit in hits[:MAX_SEARCH_HITS - self.results_list.count()]:
+            item = QListWidgetItem(self._index.snippet(hit))
+            item.setData(Qt.ItemDataRole.UserRole, hit)
+            self.results_list.addItem(item)
+
+    def _on_chapter_indexed(self, chapter: tuple):
+        self._index.add_chapter(*chapter)
+        if self._query:
+            self._add_hits(self._index.search(self._query, chapter[0]))
+        self._update_status()
+
+    def search(self):
+        self._query = self.query_edit.text()
+        self.results_list.clear()
+        self._add_hits(self._index.search(self._query))
+        self._update_status()
+
+    def _on_item_activated(self, item: QListWidgetItem):
+        hit = item.data(Qt.ItemDataRole.UserRole)
+        self.book_reader.go_to_text(
+            hit.chapter,
+            hit.start / (self._index.chapter_length(hit.chapter) or 1),
+            self._index.hit_text(hit),
+            self._index.hit_occurrence(hit),
+        )
+        self.book_reader.setFocus()
+
+
+class TocPanel(QTreeWidget):
+    def __init__(self, book_reader: BookReader, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.book_reader = book_reader
+        self.setHeaderHidden(True)
+        self._add_entries(self.invisibleRootItem(), get_toc(book_reader.book))
+        self.expandAll()
+        self.itemClicked.connect(self._on_item_activated)
+        self.itemActivated.connect(self._on_item_activated)
+
+    def _add_entries(self, parent: QTreeWidgetItem, entries: list[TocEntry]):
+        for entry in entries:
+            item = QTreeWidgetItem(parent, [entry.title])
+            item.setData(0, Qt.ItemDataRole.UserRole, entry.href)
+            self._add_entries(item, entry.children)
+
+    def _on_item_activated(self, item: QTreeWidgetItem, column: int):
+        href = item.data(0, Qt.ItemDataRole.UserRole)
+        if href and self.book_reader.navigate(href):
+            self.book_reader.setFocus()
+
+
+def load_cover_thumbnail(book: BookInfo, size: QSize) -> QImage:
+    return load_thumbnail(read_cover(book), size)
+
+
+class LibraryView(QListWidget):
+    bookActivated = pyqtSignal(str)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.thread_pool = QThreadPool(self)
+        self._items: dict[str, QListWidgetItem] = {}
+        self._requested: set[str] = set()
+        self._thumbnail_timer = QTimer(self)
+        self._thumbnail_timer.setSingleShot(True)
+        self._thumbnail_timer.setInterval(THUMBNAIL_DELAY_MS)
+        self._thumbnail_timer.timeout.connect(self._load_visible_thumbnails)
+
+        self.setViewMode(QListWidget.ViewMode.IconMode)
+        self.setMovement(QListWidget.Movement.Static)
+        self.setResizeMode(QListWidget.ResizeMode.Adjust)
+        self.setIconSize(THUMBNAIL_SIZE)
+        self.setGridSize(
+            QSize(THUMBNAIL_SIZE.width() + 40, THUMBNAIL_SIZE.height() + 60)
+        )
+        self.setWordWrap(True)
+        placeholder = QPixmap(THUMBNAIL_SIZE)
+        placeholder.fill(Qt.GlobalColor.transparent)
+        self._placeholder_icon = QIcon(placeholder)
+
+        self.itemActivated.connect(self._on_item_activated)
+        self.verticalScrollBar().valueChanged.connect(
+            lambda: self._thumbnail_timer.start()
+        )
+
+    def set_books(self, books: list[BookInfo]):
+        self.clear()
+        self._items.clear()
+        self._requested.clear()
+        for book in books:
+            text = book.title
+            if book.author is not None:
+                text += f'\n{book.author}'
+            item = QListWidgetItem(self._placeholder_icon, text)
+            item.setData(Qt.ItemDataRole.UserRole, book)
+            item.setToolTip(book.path)
+            self.addItem(item)
+            self._items[book.path] = item
+        self._thumbnail_timer.start()
+
+    def _load_visible_thumbnails(self):
+        viewport_rect = self.viewport().rect()
+        for path, item in self._items.items():
+            if (
+                path in self._requested
+                or not self.visualItemRect(item).intersects(viewport_rect)
+            ):
+                continue
+            self._requested.add(path)
+            worker = Worker(
+                load_cover_thumbnail,
+                item.data(Qt.ItemDataRole.UserRole),
+                THUMBNAIL_SIZE,
+            )
+            worker.signals.result.connect(
+                lambda image, path=path: self._set_thumbnail(path, image)
+            )
+            self.thread_pool.start(worker)
+
+    def _set_thumbnail(self, path: str, image: QImage):
+        item = self._items.get(path)
+        if item is not None and not image.isNull():
+            item.setIcon(QIcon(QPixmap.fromImage(image)))
+
+    def _on_item_activated(self, item: QListWidgetItem):
+        self.bookActivated.emit(item.data(Qt.ItemDataRole.UserRole).path)
+
+    def resizeEvent(self, e: QResizeEvent | None):
+        super().resizeEvent(e)
+        self._thumbnail_timer.start()
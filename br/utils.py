@@ -1,6 +1,7 @@
+import os
 from collections.abc import Generator
 
-from PyQt6.QtCore import QDirIterator
+from PyQt6.QtCore import QDirIterator, QStandardPaths
 
 
 def q_iter_dir(*args, **kwargs) -> Generator[str, None, None]:
@@ -8,3 +9,13 @@ def q_iter_dir(*args, **kwargs) -> Generator[str, None, None]:
     while dir_it.hasNext():
         yield dir_it.next()
 
+
+def get_cache_dir(*subdirs: str) -> str:
+    cache_dir = os.path.join(
+        QStandardPaths.writableLocation(
+            QStandardPaths.StandardLocation.CacheLocation
+        ),
+        *subdirs,
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
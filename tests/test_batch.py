@@ -0,0 +1,38 @@
+import pytest
+
+from br.imagen.backends.base import GenerationParam, GenerationParamType
+from br.imagen.batch import parse_params
+
+
+GENERATION_PARAMS = {
+    'width': GenerationParam(
+        type=GenerationParamType.COMBO_BOX,
+        display_name='Illustration Width',
+        params={'options': ('512', '1024')},
+    ),
+    'steps': GenerationParam(
+        type=GenerationParamType.INT_NUMBER,
+        display_name='Steps',
+        params={'min_value': 1, 'max_value': 8, 'init_value': 4},
+    ),
+    'progressive': GenerationParam(
+        type=GenerationParamType.CHECK_BOX,
+        display_name='Draft First',
+        params={'init_value': True},
+    ),
+}
+
+
+def test_params_follow_backend_types():
+    params = parse_params(
+        ['width=1024', 'steps=6', 'progressive=false'], GENERATION_PARAMS
+    )
+    assert params == {'width': '1024', 'steps': 6, 'progressive': False}
+
+
+@pytest.mark.parametrize(
+    'param', ['seed=1', 'steps=many', 'progressive=maybe', 'steps']
+)
+def test_invalid_params(param: str):
+    with pytest.raises(ValueError):
+        parse_params([param], GENERATION_PARAMS)
@@ -0,0 +1,47 @@
+import os
+from zipfile import ZipFile
+
+from br.library import read_book_info, read_cover, scan_library
+
+
+CONTAINER_XML = '''<?xml version="1.0"?>
+<container version="1.0"
+    xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf"
+        media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>'''
+CONTENT_OPF = '''<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:title>{title}</dc:title>
+  </metadata>
+  <manifest>
+    <item id="cover" href="images/my%20cover.png" media-type="image/png"
+        properties="cover-image"/>
+  </manifest>
+</package>'''
+
+
+def write_book(path: str, title: str):
+    with ZipFile(path, 'w') as zip:
+        zip.writestr('META-INF/container.xml', CONTAINER_XML)
+        zip.writestr('OEBPS/content.opf', CONTENT_OPF.format(title=title))
+        zip.writestr('OEBPS/images/my cover.png', b'cover')
+
+
+def test_cover_href_is_unquoted(tmp_path):
+    path = str(tmp_path / 'book.epub')
+    write_book(path, 'Book')
+    book = read_book_info(path)
+    assert book.title == 'Book'
+    assert read_cover(book) == b'cover'
+
+
+def test_missing_books_are_skipped(tmp_path):
+    write_book(str(tmp_path / 'book.epub'), 'Book')
+    os.symlink(tmp_path / 'deleted.epub', tmp_path / 'dangling.epub')
+    assert read_book_info(str(tmp_path / 'deleted.epub')) is None
+    books = scan_library(str(tmp_path), str(tmp_path / 'index.sqlite3'))
+    assert [book.title for book in books] == ['Book']
@@ -0,0 +1,10 @@
+from br.book import Chapter
+from br.imagen.passages import rank_passages, segment_chapters
+
+
+def test_separator_paragraphs_are_skipped():
+    chapter = Chapter(
+        'a.xhtml', '<p>' + 'word ' * 30 + '</p><p>' + '- ' * 60 + '</p>'
+    )
+    assert [p.paragraph for p in segment_chapters([chapter])] == [0]
+    assert [p.paragraph for p in rank_passages([chapter])] == [0]
@@ -0,0 +1,39 @@
+from br.search import SearchIndex, index_chapter
+
+
+def create_index(*htmls: str) -> SearchIndex:
+    index = SearchIndex()
+    for i, html in enumerate(htmls):
+        index.add_chapter(i, index_chapter(html))
+    return index
+
+
+def test_unquoted_words_match_anywhere_in_chapter():
+    index = create_index(
+        '<p>The red castle.</p><p>A dark hill.</p>', '<p>A red hill.</p>'
+    )
+    hits = index.search('hill castle')
+    assert {index.hit_text(hit) for hit in hits} == {'castle', 'hill'}
+    assert {hit.chapter for hit in hits} == {0}
+
+
+def test_quoted_words_match_as_phrase():
+    index = create_index('<p>The red castle.</p><p>A dark hill.</p>')
+    assert [index.hit_text(hit) for hit in index.search('"red castle"')] == [
+        'red castle'
+    ]
+    assert index.search('"castle red"') == []
+
+
+def test_prefix_terms():
+    index = create_index('<p>Castles and castings.</p>')
+    hits = index.search('cast*')
+    assert [index.hit_text(hit) for hit in hits] == ['Castles', 'castings']
+
+
+def test_hit_occurrence_counts_earlier_matches():
+    index = create_index(
+        '<p>A red hill.</p><p>The Red door.</p><p>Red, red hill.</p>'
+    )
+    hits = index.search('"red hill"') + index.search('red')
+    assert [index.hit_occurrence(hit) for hit in hits] == [0, 1, 0, 1, 2, 3]
@@ -0,0 +1,57 @@
+import os
+import re
+import sys
+import subprocess
+
+import pytest
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Imported only once an illustration or a prefetch is requested
+LAZY_MODULES = (
+    'openai',
+    'requests',
+    'numpy',
+    'br.resources',
+    'br.imagen.passages',
+    'br.imagen.backends.sd_webui',
+    'br.imagen.backends.openai',
+    'br.imagen.backends.local',
+)
+# Generous, so that only a heavy eager import fails it on a slow machine
+IMPORT_BUDGET_S = 1.0
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=ROOT_DIR,
+        env=os.environ | {'QT_QPA_PLATFORM': 'offscreen'},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def get_imported_modules(module_name: str) -> set[str]:
+    result = run_python(
+        '-c', f'import sys, {module_name}; print(*sys.modules, sep="\\n")'
+    )
+    return set(result.stdout.split())
+
+
+@pytest.mark.parametrize('module_name', LAZY_MODULES)
+def test_reader_does_not_import(module_name: str):
+    assert module_name not in get_imported_modules('br.app')
+
+
+def test_entry_point_does_not_import_qt():
+    modules = get_imported_modules('br.__main__')
+    assert not any(m.startswith('PyQt6') for m in modules)
+
+
+def test_reader_import_time():
+    result = run_python('-X', 'importtime', '-c', 'import br.app')
+    match = re.search(r'\|\s*(\d+) \| br\.app$', result.stderr, re.M)
+    assert match is not None
+    assert int(match.group(1)) / 1e6 < IMPORT_BUDGET_S